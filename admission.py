@@ -0,0 +1,269 @@
+import os
+import math
+import time
+import inspect
+import sqlite3
+import logging
+import tempfile
+import threading
+from functools import wraps
+from flask import request, jsonify
+from flask_login import current_user
+from db_routing import release_connection
+
+# Admission control settings from environment
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", 30))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 10))
+UPSTREAM_CONCURRENCY_LIMITS = {
+    'here': int(os.environ.get("HERE_CONCURRENCY_LIMIT", 16)),
+    'ors': int(os.environ.get("ORS_CONCURRENCY_LIMIT", 16)),
+}
+
+# Buckets and in-flight slots live in one SQLite file shared by every worker on the host
+ADMISSION_STORE_PATH = os.environ.get(
+    "ADMISSION_STORE_PATH",
+    os.path.join(tempfile.gettempdir(), "routewatch-admission.sqlite")
+)
+
+# Seconds before a slot left behind by a crashed worker is reclaimed
+SLOT_LEASE_SECONDS = int(os.environ.get("SLOT_LEASE_SECONDS", 300))
+
+# Seconds a client is told to wait when an upstream is saturated
+SATURATED_RETRY_AFTER = 1
+
+class AdmissionStore:
+    """
+    SQLite file in WAL mode holding token buckets and in-flight slots
+    
+    Each check runs in a BEGIN IMMEDIATE transaction, which takes the
+    database write lock, so reading a bucket or counting slots and then
+    updating them is atomic across every worker process on the host.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+    
+    def connection(self):
+        # SQLite connections must not cross threads or forked workers
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_buckets_updated ON buckets (updated)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS slots ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, upstream TEXT NOT NULL, "
+                "weight INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_slots_upstream ON slots (upstream, expires_at)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+    
+    def transaction(self):
+        """Connection with the write lock held; commit or roll back when done"""
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+class RateLimiter:
+    """Token buckets per client key, shared by every worker through the admission store"""
+    
+    def __init__(self, store, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, prune_every=1000):
+        self.store = store
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.prune_every = prune_every
+        self._checks = 0
+    
+    def check(self, keys, cost=1):
+        """
+        Charge cost to every bucket in keys
+        
+        Returns:
+            float: 0 if admitted, otherwise seconds until the request would be
+        """
+        # Wall-clock time, since buckets are compared across processes
+        now = time.time()
+        connection = self.store.transaction()
+        try:
+            placeholders = ','.join('?' * len(keys))
+            stored = {
+                key: (tokens, updated) for key, tokens, updated in connection.execute(
+                    f"SELECT key, tokens, updated FROM buckets WHERE key IN ({placeholders})", keys
+                )
+            }
+            
+            tokens = {}
+            for key in keys:
+                available, updated = stored.get(key, (self.burst, now))
+                tokens[key] = min(self.burst, available + max(0, now - updated) * self.rate)
+            
+            # Only charge when every bucket can pay, so a rejected request
+            # does not drain the buckets that had room
+            wait = max((cost - available) / self.rate for available in tokens.values())
+            if wait > 0:
+                connection.execute("ROLLBACK")
+                return wait
+            
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, available - cost, now) for key, available in tokens.items()]
+            )
+            
+            self._checks += 1
+            if self._checks >= self.prune_every:
+                self._checks = 0
+                self._prune(connection, now)
+            connection.execute("COMMIT")
+            return 0
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def _prune(self, connection, now):
+        """Forget buckets that have refilled completely"""
+        connection.execute("DELETE FROM buckets WHERE updated < ?", (now - self.burst / self.rate,))
+
+class ConcurrencyLimiter:
+    """
+    Cap on in-flight requests to one upstream from all workers on the host
+    
+    Each admitted request holds a slot row weighted by the upstream calls it
+    makes. Slots expire after SLOT_LEASE_SECONDS so that a worker killed
+    mid-request cannot hold its share of the limit forever.
+    """
+    
+    def __init__(self, store, name, limit, lease=SLOT_LEASE_SECONDS):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.lease = lease
+    
+    def try_acquire(self, weight=1):
+        """Take weight units of the limit; returns the slot id, or None if full"""
+        weight = min(weight, self.limit)
+        now = time.time()
+        connection = self.store.transaction()
+        try:
+            connection.execute("DELETE FROM slots WHERE upstream = ? AND expires_at < ?", (self.name, now))
+            active = connection.execute(
+                "SELECT COALESCE(SUM(weight), 0) FROM slots WHERE upstream = ?", (self.name,)
+            ).fetchone()[0]
+            if active + weight > self.limit:
+                connection.execute("COMMIT")
+                return None
+            
+            slot_id = connection.execute(
+                "INSERT INTO slots (upstream, weight, expires_at) VALUES (?, ?, ?)",
+                (self.name, weight, now + self.lease)
+            ).lastrowid
+            connection.execute("COMMIT")
+            return slot_id
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def release(self, slot_id):
+        self.store.connection().execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+    
+    def active(self):
+        """Units of the limit currently held"""
+        return self.store.connection().execute(
+            "SELECT COALESCE(SUM(weight), 0) FROM slots WHERE upstream = ? AND expires_at >= ?",
+            (self.name, time.time())
+        ).fetchone()[0]
+
+admission_store = AdmissionStore(ADMISSION_STORE_PATH)
+rate_limiter = RateLimiter(admission_store)
+upstream_limiters = {
+    name: ConcurrencyLimiter(admission_store, name, limit) for name, limit in UPSTREAM_CONCURRENCY_LIMITS.items()
+}
+
+def client_keys():
+    """Rate-limit keys for the current request: the user if logged in, and the IP"""
+    keys = [f"ip:{request.remote_addr}"]
+    if current_user.is_authenticated:
+        keys.append(f"user:{current_user.id}")
+    return keys
+
+def too_many_requests(retry_after, error):
+    """Fast 429 response telling the client when to retry"""
+    response = jsonify({
+        'success': False,
+        'error': error
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def admission_controlled(upstream, cost=1):
+    """
+    Admit a view only if the client has tokens and the upstream has capacity
+    
+    cost is the number of upstream calls the view makes, or a function
+    returning it for the current request. Use on endpoints that call HERE or
+    ORS. Never apply this to /send-sos: emergency alerts must not be shed.
+    """
+    limiter = upstream_limiters[upstream]
+    
+    def admit():
+        """Returns (rejection response or None, slot id to release or None)"""
+        request_cost = cost() if callable(cost) else cost
+        try:
+            retry_after = rate_limiter.check(client_keys(), request_cost)
+            if retry_after:
+                logging.warning(f"Rate limited {request.path} for {client_keys()}")
+                return too_many_requests(retry_after, 'Too many requests. Please try again shortly.'), None
+            slot_id = limiter.try_acquire(request_cost)
+            if slot_id is None:
+                logging.warning(f"Shed {request.path}: {upstream} concurrency limit {limiter.limit} reached")
+                return too_many_requests(SATURATED_RETRY_AFTER, 'Service is busy. Please try again shortly.'), None
+            return None, slot_id
+        except sqlite3.Error as e:
+            # A broken admission store must not take routing down with it
+            logging.error(f"Error reading admission store, admitting {request.path}: {str(e)}")
+            return None, None
+    
+    def release(slot_id):
+        if slot_id is None:
+            return
+        try:
+            limiter.release(slot_id)
+        except sqlite3.Error as e:
+            # The slot lease expires on its own
+            logging.error(f"Error releasing {upstream} slot {slot_id}: {str(e)}")
+    
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                rejection, slot_id = admit()
+                if rejection is not None:
+                    return rejection
+                try:
+                    # Loading the user for the rate limit checked out a connection
+                    release_connection()
+                    return await view(*args, **kwargs)
+                finally:
+                    release(slot_id)
+            return async_wrapper
+        
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            rejection, slot_id = admit()
+            if rejection is not None:
+                return rejection
+            try:
+                return view(*args, **kwargs)
+            finally:
+                release(slot_id)
+        return wrapper
+    
+    return decorator
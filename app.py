@@ -4,6 +4,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
+from db_routing import RoutingSession, replica_binds, init_read_replicas
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,27 +13,48 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-# Initialize SQLAlchemy
-db = SQLAlchemy(model_class=Base)
+# Initialize SQLAlchemy; reads can be routed to replicas per request
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 # Create the Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
 # Configure the database
-database_url = os.environ.get("DATABASE_URL")
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+def normalize_database_url(url):
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def engine_options(prefix):
+    """Pool settings for one engine, sized by {prefix}_POOL_SIZE and {prefix}_MAX_OVERFLOW"""
+    options = {
+        "pool_recycle": 300,
+        "pool_pre_ping": os.environ.get("DATABASE_POOL_PRE_PING", "true").lower() == "true",
+    }
+    for name in ("pool_size", "max_overflow"):
+        value = os.environ.get(f"{prefix}_{name.upper()}")
+        if value:
+            options[name] = int(value)
+    return options
+
+database_url = normalize_database_url(os.environ.get("DATABASE_URL"))
+
+# Comma-separated read replica URLs; read-only views are served from these
+replica_urls = [
+    normalize_database_url(url.strip())
+    for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
 
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url or "sqlite:///routeoptimizer.db"
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options("DATABASE")
+app.config["SQLALCHEMY_BINDS"] = replica_binds(replica_urls, engine_options("DATABASE_REPLICA"))
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Initialize the database with the Flask app
 db.init_app(app)
+init_read_replicas(app)
 
 # Setup Flask-Login
 login_manager = LoginManager()
@@ -46,3 +68,11 @@ from routes import *
 with app.app_context():
     import models
     db.create_all()
+    
+    # create_all skips indexes added to tables that already exist
+    for model in (models.SOSRequest, models.CNGStation):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Register the SOS archival CLI command
+import sos_archive
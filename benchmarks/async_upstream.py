@@ -0,0 +1,162 @@
+"""
+Benchmark: concurrent /find-route requests on one gunicorn worker
+
+Starts a local stub of the ORS directions endpoint that answers after a fixed
+delay, then serves the app from a single gunicorn worker and sends N
+concurrent POST /find-route requests to it over HTTP. Runs once with the
+default sync worker and twice with the threaded worker from gunicorn.conf.py,
+anonymously and logged in, so the numbers include everything a deployment
+pays: WSGI, loading the user, admission control and rendering the map.
+
+Usage:
+    python benchmarks/async_upstream.py [--requests 200] [--latency 0.2] [--threads 200]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STUB_PORT = 8765
+STUB_URL = f"http://127.0.0.1:{STUB_PORT}"
+APP_PORT = 8766
+APP_URL = f"http://127.0.0.1:{APP_PORT}"
+
+ROUTE_RESPONSE = {
+    "type": "FeatureCollection",
+    "features": [{
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[77.20, 28.61], [77.23, 28.63]]},
+        "properties": {"summary": {"distance": 4200.0, "duration": 610.0}}
+    }]
+}
+
+def start_stub(latency):
+    """Run the stub upstream in a background thread"""
+    async def directions(request):
+        await asyncio.sleep(latency)
+        return web.json_response(ROUTE_RESPONSE)
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/v2/directions/{profile}/geojson", directions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", STUB_PORT, backlog=1024).start()
+        await asyncio.Event().wait()
+
+    thread = threading.Thread(target=lambda: asyncio.run(serve()), daemon=True)
+    thread.start()
+    time.sleep(0.5)
+
+def start_app(worker_class, threads, workdir):
+    """Serve main:app from one gunicorn worker of the given class"""
+    env = dict(
+        os.environ,
+        ORS_BASE_URL=STUB_URL,
+        # Every request should reach the upstream and none should be shed
+        UPSTREAM_CACHE_URL="none://",
+        RATE_LIMIT_PER_MINUTE="1000000",
+        RATE_LIMIT_BURST="1000000",
+        ORS_CONCURRENCY_LIMIT="100000",
+        ADMISSION_STORE_PATH=os.path.join(workdir, "admission.sqlite"),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        TRAFFIC_HISTORY_DIR=os.path.join(workdir, "traffic_history"),
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{APP_PORT}", "--workers", "1",
+            "--worker-class", worker_class, "--threads", str(threads),
+            "--backlog", "2048", "--log-level", "warning", "main:app",
+        ],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(_get(f"{APP_URL}/tiles/stations/0/0/0"))
+            return process
+        except aiohttp.ClientError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn did not start")
+
+async def _get(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            await response.read()
+
+async def log_in(session):
+    """Register and log in a benchmark user, keeping its cookie in session"""
+    account = {"username": "bench", "email": "bench@example.com", "password": "bench-password"}
+    async with session.post(f"{APP_URL}/register", data=dict(account, confirm_password=account["password"]),
+                            allow_redirects=False) as response:
+        await response.read()
+    async with session.post(f"{APP_URL}/login", data=account, allow_redirects=False) as response:
+        await response.read()
+
+async def fire(count, logged_in=False):
+    """Send count concurrent /find-route requests; returns (seconds, failures)"""
+    form = {
+        "start_lat": "28.61", "start_lng": "77.20",
+        "end_lat": "28.63", "end_lng": "77.23",
+    }
+    connector = aiohttp.TCPConnector(limit=count)
+    timeout = aiohttp.ClientTimeout(total=600)
+    cookies = aiohttp.CookieJar(unsafe=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, cookie_jar=cookies) as session:
+        # A logged-in request loads its user from the database before the upstream call
+        if logged_in:
+            await log_in(session)
+
+        async def one():
+            async with session.post(f"{APP_URL}/find-route", data=form) as response:
+                body = await response.json(content_type=None)
+                return response.status == 200 and body.get("success")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one() for _ in range(count)])
+        return time.perf_counter() - start, results.count(False)
+
+def bench(worker_class, threads, count, workdir, logged_in=False):
+    process = start_app(worker_class, threads, workdir)
+    try:
+        asyncio.run(fire(1, logged_in))
+        return asyncio.run(fire(count, logged_in))
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--threads", type=int, default=200)
+    args = parser.parse_args()
+
+    start_stub(args.latency)
+    print(f"upstream latency: {args.latency * 1000:.0f} ms, concurrent requests: {args.requests}")
+
+    scenarios = (
+        ("sync", 1, False),
+        ("gthread", args.threads, False),
+        ("gthread", args.threads, True),
+    )
+    for worker_class, threads, logged_in in scenarios:
+        with tempfile.TemporaryDirectory() as workdir:
+            elapsed, failures = bench(worker_class, threads, args.requests, workdir, logged_in)
+        who = "logged in" if logged_in else "anonymous"
+        print(f"one {worker_class:7} worker ({threads:3} threads), {who:9}: {elapsed:7.2f} s  "
+              f"({args.requests / elapsed:7.1f} req/s, {failures} failed)")
+
+if __name__ == "__main__":
+    main()
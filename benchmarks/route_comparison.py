@@ -0,0 +1,90 @@
+"""
+Benchmark: comparing transport modes sequentially vs concurrently
+
+Starts a local stub of the ORS directions endpoint whose latency depends on
+the profile, then times fetching car, bike and walking routes one after
+another (what the UI did with three /find-route calls) against
+compare_routes_async.
+
+Usage:
+    python benchmarks/route_comparison.py [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PORT = 8766
+STUB_URL = f"http://127.0.0.1:{STUB_PORT}"
+
+# Point the async client at the stub and bypass the shared cache
+os.environ["ORS_BASE_URL"] = STUB_URL
+os.environ["UPSTREAM_CACHE_URL"] = "none://"
+
+import helpers
+
+PROFILE_LATENCY = {'driving-car': 0.30, 'cycling-regular': 0.25, 'foot-walking': 0.20}
+
+def route_response(duration):
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[77.20, 28.61], [77.23, 28.63]]},
+            "properties": {"summary": {"distance": 4200.0, "duration": duration}}
+        }]
+    }
+
+def start_stub():
+    """Run the stub upstream in a background thread"""
+    async def directions(request):
+        profile = request.match_info['profile']
+        await asyncio.sleep(PROFILE_LATENCY[profile])
+        return web.json_response(route_response(600.0))
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/v2/directions/{profile}/geojson", directions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", STUB_PORT).start()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    time.sleep(0.5)
+
+async def sequential():
+    for profile in PROFILE_LATENCY:
+        result = await helpers.get_optimal_route_async([77.20, 28.61], [77.23, 28.63], profile)
+        assert "error" not in result, result
+
+async def concurrent():
+    results = await helpers.compare_routes_async([77.20, 28.61], [77.23, 28.63], list(PROFILE_LATENCY))
+    assert all("error" not in r for r in results.values()), results
+
+def timed(coroutine_function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        asyncio.run(coroutine_function())
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    start_stub()
+    sequential_ms = timed(sequential, args.repeat)
+    concurrent_ms = timed(concurrent, args.repeat)
+    print(f"profile latencies: {', '.join(f'{p} {l * 1000:.0f} ms' for p, l in PROFILE_LATENCY.items())}")
+    print(f"sequential: {sequential_ms:7.1f} ms (sum {sum(PROFILE_LATENCY.values()) * 1000:.0f} ms)")
+    print(f"concurrent: {concurrent_ms:7.1f} ms (slowest {max(PROFILE_LATENCY.values()) * 1000:.0f} ms)")
+
+if __name__ == "__main__":
+    main()
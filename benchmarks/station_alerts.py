@@ -0,0 +1,86 @@
+"""
+Benchmark: matching a station change against many subscriptions
+
+Indexes synthetic subscriptions spread over India and times matching a
+change, comparing the grid index against checking every subscription.
+Matching time should track the number of subscriptions near the station,
+not the total.
+
+Usage:
+    python benchmarks/station_alerts.py [--subscriptions 10000 100000] [--repeat 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import app  # Loads the routes, which import station_alerts in order
+from station_alerts import SubscriptionIndex, notifies
+
+def make_subscriptions(count, rng):
+    return [
+        SimpleNamespace(
+            id=i,
+            latitude=rng.uniform(8, 32),
+            longitude=rng.uniform(70, 90),
+            radius=rng.choice([2000, 5000, 10000, 25000]),
+            statuses=rng.choice([None, 'maintenance', 'closed,maintenance']),
+            price_changes=rng.random() < 0.5,
+            webhook_url=None,
+            active=True
+        )
+        for i in range(count)
+    ]
+
+def make_changes(count, rng):
+    return [
+        {
+            'latitude': rng.uniform(8, 32),
+            'longitude': rng.uniform(70, 90),
+            'old_status': 'operational',
+            'new_status': 'maintenance',
+            'old_price': 80.0,
+            'new_price': rng.choice([80.0, 82.5])
+        }
+        for _ in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    changes = make_changes(args.repeat, rng)
+
+    for count in args.subscriptions:
+        subscriptions = make_subscriptions(count, rng)
+        index = SubscriptionIndex()
+        start = time.perf_counter()
+        for subscription in subscriptions:
+            index.upsert(subscription)
+        print(f"{count} subscriptions indexed in {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        matched = sum(len(index.match(change)) for change in changes)
+        indexed = (time.perf_counter() - start) * 1e6 / len(changes)
+
+        entries = [index.get(subscription.id) for subscription in subscriptions]
+        sample = changes[:max(1, min(len(changes), 10000000 // count))]
+        start = time.perf_counter()
+        for change in sample:
+            [entry for entry in entries if notifies(entry, change)]
+        scanned = (time.perf_counter() - start) * 1e6 / len(sample)
+
+        print(f"  grid index: {indexed:8.1f} us per change ({matched / len(changes):.1f} matches)")
+        print(f"  full scan:  {scanned:8.1f} us per change")
+
+if __name__ == "__main__":
+    main()
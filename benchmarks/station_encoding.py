@@ -0,0 +1,107 @@
+"""
+Benchmark: encoding nearby-station responses per 1k stations
+
+Compares the original path (build a dict per station, json-encode the list and
+format a popup per station) with the cached path (reuse pre-serialized
+fragments and popup markup, append only the distance).
+
+Usage:
+    python benchmarks/station_encoding.py [--stations 1000] [--repeat 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import station_cache
+
+def make_stations(count, rng):
+    return [
+        SimpleNamespace(
+            id=i,
+            name=f"Indraprastha Gas Station {i}",
+            latitude=28.6 + rng.uniform(-0.05, 0.05),
+            longitude=77.2 + rng.uniform(-0.05, 0.05),
+            address=f"Plot {i}, Sector {i % 60}, New Delhi",
+            status=rng.choice(['operational', 'maintenance', 'closed']),
+            price=rng.uniform(70, 95),
+            operating_hours='24/7',
+            created_at=datetime(2025, 1, 1),
+            updated_at=None
+        )
+        for i in range(count)
+    ]
+
+def original_path(stations, distances):
+    nearby = []
+    for station, distance in zip(stations, distances):
+        nearby.append({
+            'id': station.id,
+            'name': station.name,
+            'latitude': station.latitude,
+            'longitude': station.longitude,
+            'address': station.address,
+            'status': station.status,
+            'price': station.price,
+            'operating_hours': station.operating_hours,
+            'distance': distance
+        })
+    popups = [
+        f"""
+        <strong>{s['name']}</strong><br>
+        Status: {s['status']}<br>
+        Price: ₹{s['price']:.2f}/kg<br>
+        Address: {s['address']}<br>
+        Hours: {s['operating_hours']}<br>
+        Distance: {s['distance']:.2f} meters
+        """
+        for s in nearby
+    ]
+    return json.dumps({'success': True, 'stations': nearby}), popups
+
+def cached_path(stations, distances):
+    nearby = [
+        dict(station_cache.get_station_payload(station).fields, distance=distance)
+        for station, distance in zip(stations, distances)
+    ]
+    popups = [station_cache.station_popup_html(s) for s in nearby]
+    return '{"success":true,"stations":' + station_cache.encode_stations(nearby) + '}', popups
+
+def timed(function, repeat, *args):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    stations = make_stations(args.stations, rng)
+    distances = [rng.uniform(0, 5000) for _ in stations]
+
+    # Both paths must produce the same payload
+    before, before_popups = original_path(stations, distances)
+    cached_path(stations, distances)
+    after, after_popups = cached_path(stations, distances)
+    assert json.loads(before) == json.loads(after) and before_popups == after_popups
+
+    scale = 1000 / args.stations
+    original_ms = timed(original_path, args.repeat, stations, distances) * scale
+    cached_ms = timed(cached_path, args.repeat, stations, distances) * scale
+    encoder = 'orjson' if station_cache.orjson is not None else 'json'
+    print(f"original: {original_ms:7.2f} ms per 1k stations")
+    print(f"cached:   {cached_ms:7.2f} ms per 1k stations ({encoder} encoder, warm cache)")
+    print(f"speed-up: {original_ms / cached_ms:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: station search latency at 100k stations
+
+Builds the in-memory search index over synthetic stations and times prefix,
+multi-word, typo and geographically biased queries.
+
+Usage:
+    python benchmarks/station_search.py [--stations 100000] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from station_search import StationSearchIndex
+
+BRANDS = ['Indraprastha', 'Mahanagar', 'Gujarat', 'Adani', 'Torrent', 'Bharat', 'Haryana City', 'Green']
+AREAS = ['Dwarka', 'Rohini', 'Saket', 'Noida', 'Gurugram', 'Andheri', 'Powai', 'Thane', 'Baner', 'Whitefield']
+
+QUERIES = [
+    ('prefix', 'indra', None),
+    ('two words', 'indraprastha sector 12', None),
+    ('typo', 'mahanagr gas dwrka', None),
+    ('geo biased', 'adani sec', (28.6, 77.2)),
+    ('common word', 'gas', None),
+]
+
+def make_stations(count, rng):
+    return [
+        SimpleNamespace(
+            id=i,
+            name=f"{rng.choice(BRANDS)} Gas {rng.choice(AREAS)} {i % 500}",
+            address=f"Plot {rng.randint(1, 999)}, Sector {rng.randint(1, 150)}, {rng.choice(AREAS)}",
+            latitude=rng.uniform(8, 32),
+            longitude=rng.uniform(70, 90),
+            status='operational'
+        )
+        for i in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stations", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    stations = make_stations(args.stations, random.Random(11))
+    index = StationSearchIndex()
+    start = time.perf_counter()
+    for station in stations:
+        index.upsert(station)
+    print(f"indexed {len(index)} stations in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    for station in stations[:1000]:
+        station.name += " Updated"
+        index.upsert(station)
+    print(f"incremental update: {(time.perf_counter() - start) * 1000 / 1000:.3f} ms per station")
+
+    for label, query, location in QUERIES:
+        latitude, longitude = location or (None, None)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = index.search(query, latitude, longitude)
+        elapsed = (time.perf_counter() - start) * 1000 / args.repeat
+        top = results[0]['name'] if results else '-'
+        print(f"{label:<12} {query!r:<26} {elapsed:7.2f} ms  top: {top}")
+
+if __name__ == "__main__":
+    main()
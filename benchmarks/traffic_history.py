@@ -0,0 +1,76 @@
+"""
+Benchmark: historical traffic range queries
+
+Writes synthetic snapshots (one every 5 minutes, for several areas, over a
+number of days) into a temporary store, checks that repeating a snapshot
+within its time bucket writes nothing, then times a weekday rush-hour query
+for one area and reports the storage used per day.
+
+Usage:
+    python benchmarks/traffic_history.py [--days 60] [--items 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as clock, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import traffic_history
+
+CENTRES = [(28.61, 77.21), (19.07, 72.87), (12.97, 77.59), (22.57, 88.36)]
+
+def snapshot(rng, latitude, longitude, items):
+    return {'trafficItems': [
+        {
+            'location': {'geolocation': {'coordinates': [
+                longitude + rng.uniform(-0.02, 0.02), latitude + rng.uniform(-0.02, 0.02)
+            ]}},
+            'criticality': rng.randint(0, 4)
+        }
+        for _ in range(items)
+    ]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--items", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    traffic_history.TRAFFIC_HISTORY_DIR = tempfile.mkdtemp(prefix="traffic-history-")
+    first_day = date(2025, 1, 6)
+
+    start = time.perf_counter()
+    records = 0
+    for offset in range(args.days):
+        day = first_day + timedelta(days=offset)
+        for minute in range(0, 24 * 60, 5):
+            when = datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(minutes=minute)
+            for latitude, longitude in CENTRES:
+                last = snapshot(rng, latitude, longitude, args.items)
+                records += traffic_history.record_traffic_snapshot(last, when)
+    print(f"wrote {records:,} records in {time.perf_counter() - start:.1f} s")
+
+    # An overlapping query in the same bucket returns the same items again
+    repeated = traffic_history.record_traffic_snapshot(last, when + timedelta(seconds=30))
+    print(f"same items again within {traffic_history.TRAFFIC_SNAPSHOT_SECONDS} s: {repeated} records written")
+
+    size = os.path.getsize(traffic_history.day_path(first_day))
+    print(f"storage per day: {size / 1e6:.1f} MB ({traffic_history.RECORD_DTYPE.itemsize} bytes/record)")
+
+    start = time.perf_counter()
+    found = traffic_history.query_traffic_history(
+        28.61, 77.21, first_day, first_day + timedelta(days=args.days - 1),
+        weekdays={0, 1, 2, 3, 4}, start_time=clock(8), end_time=clock(9)
+    )
+    elapsed = time.perf_counter() - start
+    summary = traffic_history.summarize_locations(found)
+    print(f"weekdays 08-09 over {args.days} days: {len(found):,} records in {elapsed * 1000:.1f} ms "
+          f"({len(summary):,} locations)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark: multi-stop solve time against stop count
+
+Builds random travel-time matrices for stops scattered over a city-sized area
+and reports how long solve_stop_order takes and how much it improves on the
+plain nearest-neighbour tour.
+
+Usage:
+    python benchmarks/trip_optimizer.py [--budget 0.5] [--trials 5]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trip_optimizer import solve_stop_order, route_cost, _nearest_neighbour
+
+def random_matrix(count, rng):
+    """Travel times in seconds at ~30 km/h with some one-way asymmetry"""
+    points = [(rng.uniform(0, 20000), rng.uniform(0, 20000)) for _ in range(count)]
+    matrix = []
+    for i, (x1, y1) in enumerate(points):
+        row = []
+        for j, (x2, y2) in enumerate(points):
+            metres = math.hypot(x2 - x1, y2 - y1) * 1.3
+            row.append(0 if i == j else metres / 8.3 * rng.uniform(0.9, 1.2))
+        matrix.append(row)
+    return matrix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=0.5)
+    parser.add_argument("--trials", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'stops':>5}  {'solve ms (avg)':>14}  {'solve ms (max)':>14}  {'vs nearest-neighbour':>20}")
+    for count in (10, 20, 30, 50, 100):
+        timings, gains = [], []
+        for _ in range(args.trials):
+            matrix = random_matrix(count, rng)
+            start = time.perf_counter()
+            order = solve_stop_order(matrix, time_budget=args.budget)
+            timings.append((time.perf_counter() - start) * 1000)
+            
+            baseline = route_cost(matrix, _nearest_neighbour(matrix))
+            gains.append(1 - route_cost(matrix, order) / baseline)
+        
+        print(f"{count:>5}  {sum(timings) / len(timings):>14.1f}  {max(timings):>14.1f}  "
+              f"{sum(gains) / len(gains) * 100:>19.1f}%")
+
+if __name__ == "__main__":
+    main()
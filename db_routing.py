@@ -0,0 +1,114 @@
+import os
+import time
+import random
+from functools import wraps
+from contextlib import contextmanager
+from flask import current_app, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+# Seconds a client keeps reading from the primary after it writes
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", 10))
+
+# Flask session key holding the time until which reads stay on the primary
+PRIMARY_UNTIL_KEY = '_db_primary_until'
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a read replica when the request allows it
+    
+    A request opts in with read_replica; its session then carries the chosen
+    replica engine in info['replica']. Plain SELECTs go to that replica.
+    Flushes, INSERT/UPDATE/DELETE statements and locking reads go to the
+    primary, and once the session has written, every later read in the same
+    request goes to the primary as well.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+                self.info.pop('replica', None)
+            else:
+                replica = self.info.get('replica')
+                if replica is not None and _is_plain_read(clause):
+                    return replica
+        
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _is_plain_read(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+def replica_binds(urls, engine_options):
+    """SQLALCHEMY_BINDS entries for a list of replica database URLs"""
+    return {
+        f"replica_{number}": dict(engine_options, url=url)
+        for number, url in enumerate(urls)
+    }
+
+def init_read_replicas(app):
+    """Keep clients that just wrote on the primary for REPLICA_STICKY_SECONDS"""
+    @app.after_request
+    def remember_write(response):
+        if not replica_keys(app):
+            return response
+        
+        db = app.extensions['sqlalchemy']
+        if db.session.info.get('wrote'):
+            session[PRIMARY_UNTIL_KEY] = time.time() + REPLICA_STICKY_SECONDS
+        return response
+
+def replica_keys(app):
+    return [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith('replica_')]
+
+def use_read_replica():
+    """Send this request's reads to a randomly chosen replica, if any is configured"""
+    keys = replica_keys(current_app)
+    if not keys:
+        return
+    
+    # Read-your-writes: a client that wrote recently reads from the primary
+    if session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+        return
+    
+    db = current_app.extensions['sqlalchemy']
+    db.session.info['replica'] = db.engines[random.choice(keys)]
+
+def release_connection():
+    """
+    End the session's transaction so its pooled connection is free while the request waits
+    
+    Call before awaiting an upstream: otherwise a request that loaded its
+    user keeps a connection for the whole wait, and the pool, not the
+    worker's threads, caps how many requests can wait at once. Loaded
+    objects keep their values, so using them later does not check out a
+    connection again.
+    """
+    db = current_app.extensions['sqlalchemy']
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+@contextmanager
+def primary_reads():
+    """Run the enclosed queries on the primary, even inside a read_replica view"""
+    db = current_app.extensions['sqlalchemy']
+    replica = db.session.info.pop('replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None and not db.session.info.get('wrote'):
+            db.session.info['replica'] = replica
+
+def read_replica(view):
+    """Mark a read-only view whose queries may be served by a read replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_read_replica()
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,17 @@
+import os
+
+# Gunicorn settings, used with: gunicorn -c gunicorn.conf.py main:app
+#
+# Async views run each coroutine to completion in the thread serving the
+# request, so a worker holds as many concurrent upstream waits, and open
+# SOS or station streams, as it has threads. The default sync worker would
+# serve them one at a time. Views hand back their database connection before
+# waiting on an upstream, so the pool does not need one per thread.
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 200))
+
+# Requests mostly wait on upstreams; streams send keepalives every 15 s
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
@@ -3,12 +3,24 @@ import requests
 import openrouteservice
 import herepy
 import logging
+import asyncio
+import aiohttp
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from trip_optimizer import solve_stop_order, route_cost
+from station_cache import get_station_payload
+from traffic_history import record_traffic_snapshot
+from upstream_cache import upstream_cache, make_cache_key, TRAFFIC_CACHE_TTL, ROUTE_CACHE_TTL
 
 # API keys from environment
 HERE_API_KEY = os.environ.get("HERE_API_KEY", "your_here_api_key")
 ORS_API_KEY = os.environ.get("ORS_API_KEY", "your_ors_api_key")
 
+# Upstream endpoints used by the async clients
+HERE_TRAFFIC_FLOW_URL = os.environ.get("HERE_TRAFFIC_FLOW_URL", "https://traffic.ls.hereapi.com/traffic/6.1/flow.json")
+ORS_BASE_URL = os.environ.get("ORS_BASE_URL", "https://api.openrouteservice.org")
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", 20))
+
 # Initialize API clients
 try:
     # OpenRouteService client
@@ -22,24 +34,105 @@ except Exception as e:
 
 def get_traffic_data(latitude, longitude, radius=2000):
     """Get traffic data around a location using HERE Traffic API"""
+    cache_key = make_cache_key('traffic', latitude, longitude)
+    cached = upstream_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Get traffic flow data
-        response = here_traffic_api.traffic_flow_within_bbox(
+        # Get traffic flow data, with road shapes so each segment can be placed
+        response = here_traffic_api.flow_within_boundingbox(
             top_left=[latitude + 0.02, longitude - 0.02],
-            bottom_right=[latitude - 0.02, longitude + 0.02]
+            bottom_right=[latitude - 0.02, longitude + 0.02],
+            response_attributes="sh,fc"
         )
         
-        if response.as_dict().get('trafficItems'):
-            return response.as_dict()
-        else:
-            # If no traffic data, return empty structure
-            return {"trafficItems": []}
+        traffic_data = _format_traffic_data(response.as_dict())
+        record_traffic_snapshot(traffic_data)
+        upstream_cache.set(cache_key, traffic_data, TRAFFIC_CACHE_TTL)
+        return traffic_data
     except Exception as e:
         logging.error(f"Error fetching traffic data: {str(e)}")
         return {"error": str(e)}
 
+async def get_traffic_data_async(latitude, longitude, radius=2000, session=None):
+    """Get traffic data around a location without blocking the event loop"""
+    cache_key = make_cache_key('traffic', latitude, longitude)
+    cached = upstream_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        params = {
+            "bbox": f"{latitude + 0.02},{longitude - 0.02};{latitude - 0.02},{longitude + 0.02}",
+            "responseattributes": "sh,fc",
+            "apiKey": HERE_API_KEY
+        }
+        async with _client_session(session) as client:
+            async with client.get(HERE_TRAFFIC_FLOW_URL, params=params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        
+        traffic_data = _format_traffic_data(data)
+        record_traffic_snapshot(traffic_data)
+        upstream_cache.set(cache_key, traffic_data, TRAFFIC_CACHE_TTL)
+        return traffic_data
+    except Exception as e:
+        logging.error(f"Error fetching traffic data: {str(e)}")
+        return {"error": str(e)}
+
+def _format_traffic_data(data):
+    """
+    Normalise a HERE traffic response to the structure used by the views
+    
+    Flow responses (RWS) become one traffic item per road segment, placed at
+    the middle of its shape, with a criticality of half its jam factor
+    rounded: 0 for free flow up to 5 for standstill.
+    """
+    if data.get('trafficItems'):
+        return data
+    
+    items = []
+    for road_set in data.get('RWS') or []:
+        for road in road_set.get('RW') or []:
+            for flow_set in road.get('FIS') or []:
+                for flow_item in flow_set.get('FI') or []:
+                    item = _flow_traffic_item(flow_item)
+                    if item is not None:
+                        items.append(item)
+    
+    return {"trafficItems": items}
+
+def _flow_traffic_item(flow_item):
+    """Traffic item for one RWS flow item, or None without a shape or current flow"""
+    points = [
+        point.split(',')
+        for shape in flow_item.get('SHP') or []
+        for value in shape.get('value') or []
+        for point in value.split()
+    ]
+    current_flow = (flow_item.get('CF') or [{}])[0]
+    if not points or current_flow.get('JF') is None:
+        return None
+    
+    latitude, longitude = (float(c) for c in points[len(points) // 2][:2])
+    jam_factor = float(current_flow['JF'])
+    return {
+        'location': {'geolocation': {'coordinates': [longitude, latitude]}},
+        'criticality': int(round(jam_factor / 2)),
+        'jamFactor': jam_factor,
+        'speed': current_flow.get('SU'),
+        'freeFlowSpeed': current_flow.get('FF'),
+        'description': (flow_item.get('TMC') or {}).get('DE', 'Traffic flow')
+    }
+
 def get_optimal_route(start_coords, end_coords, transport_mode='driving-car'):
     """Get optimal route using OpenRouteService API"""
+    cache_key = make_cache_key('route', transport_mode, *[float(c) for c in start_coords + end_coords])
+    cached = upstream_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
         # Request directions
         coords = [start_coords, end_coords]
@@ -51,39 +144,154 @@ def get_optimal_route(start_coords, end_coords, transport_mode='driving-car'):
             validate=False
         )
         
-        # Extract route details
-        if routes and 'features' in routes and len(routes['features']) > 0:
-            route = routes['features'][0]
-            properties = route['properties']
-            
-            # Calculate duration in hours, minutes, seconds
-            duration_sec = properties['summary']['duration']
-            hours = int(duration_sec // 3600)
-            minutes = int((duration_sec % 3600) // 60)
-            seconds = int(duration_sec % 60)
-            
-            # Calculate distance in kilometers
-            distance_km = properties['summary']['distance'] / 1000
-            
-            return {
-                'route': route,
-                'duration': {
-                    'hours': hours,
-                    'minutes': minutes,
-                    'seconds': seconds,
-                    'total_seconds': duration_sec
-                },
-                'distance': {
-                    'km': distance_km,
-                    'formatted': f"{distance_km:.2f} km"
-                }
-            }
-        else:
-            return {"error": "No route found"}
+        route_data = _format_route(routes)
+        if 'error' not in route_data:
+            upstream_cache.set(cache_key, route_data, ROUTE_CACHE_TTL)
+        return route_data
+    except Exception as e:
+        logging.error(f"Error fetching optimal route: {str(e)}")
+        return {"error": str(e)}
+
+async def get_optimal_route_async(start_coords, end_coords, transport_mode='driving-car', session=None):
+    """Get optimal route from OpenRouteService without blocking the event loop"""
+    return await get_waypoint_route_async([start_coords, end_coords], transport_mode, session)
+
+async def compare_routes_async(start_coords, end_coords, transport_modes):
+    """
+    Get the optimal route for several transport modes concurrently
+    
+    Returns:
+        dict: Route data (or an error dict) per transport mode
+    """
+    timeout = aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        routes = await asyncio.gather(*[
+            get_optimal_route_async(start_coords, end_coords, transport_mode, session)
+            for transport_mode in transport_modes
+        ])
+    return dict(zip(transport_modes, routes))
+
+async def get_waypoint_route_async(waypoints, transport_mode='driving-car', session=None):
+    """Get a route through [lng, lat] waypoints in the given order"""
+    cache_key = make_cache_key('route', transport_mode, *[float(c) for point in waypoints for c in point])
+    cached = upstream_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        # Same request the openrouteservice client sends for directions()
+        payload = {
+            'coordinates': waypoints,
+            'options': {'avoid_features': ['tollways']}
+        }
+        headers = {'Authorization': ORS_API_KEY}
+        url = f"{ORS_BASE_URL}/v2/directions/{transport_mode}/geojson"
+        
+        async with _client_session(session) as client:
+            async with client.post(url, json=payload, headers=headers) as response:
+                response.raise_for_status()
+                routes = await response.json(content_type=None)
+        
+        route_data = _format_route(routes)
+        if 'error' not in route_data:
+            upstream_cache.set(cache_key, route_data, ROUTE_CACHE_TTL)
+        return route_data
     except Exception as e:
         logging.error(f"Error fetching optimal route: {str(e)}")
         return {"error": str(e)}
 
+async def get_travel_time_matrix_async(locations, transport_mode='driving-car', session=None):
+    """Get the travel-time matrix between [lng, lat] locations in one ORS call"""
+    try:
+        payload = {
+            'locations': locations,
+            'metrics': ['duration']
+        }
+        headers = {'Authorization': ORS_API_KEY}
+        url = f"{ORS_BASE_URL}/v2/matrix/{transport_mode}"
+        
+        async with _client_session(session) as client:
+            async with client.post(url, json=payload, headers=headers) as response:
+                response.raise_for_status()
+                matrix = await response.json(content_type=None)
+        
+        if not matrix.get('durations'):
+            return {"error": "No travel times found"}
+        return {'durations': matrix['durations']}
+    except Exception as e:
+        logging.error(f"Error fetching travel time matrix: {str(e)}")
+        return {"error": str(e)}
+
+async def get_multi_stop_route_async(stops, transport_mode='driving-car', return_to_start=False, time_budget=0.5):
+    """
+    Plan a trip through several stops, starting at the first one
+    
+    Fetches the travel-time matrix in a single upstream call, orders the
+    stops locally and requests one route for the ordered waypoints.
+    """
+    timeout = aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        matrix = await get_travel_time_matrix_async(stops, transport_mode, session)
+        if 'error' in matrix:
+            return matrix
+        
+        order = solve_stop_order(matrix['durations'], return_to_start, time_budget)
+        
+        waypoints = [stops[index] for index in order]
+        if return_to_start:
+            waypoints.append(stops[order[0]])
+        
+        route_data = await get_waypoint_route_async(waypoints, transport_mode, session)
+    
+    if 'error' in route_data:
+        return route_data
+    
+    route_data['order'] = order
+    route_data['estimated_seconds'] = route_cost(matrix['durations'], order, return_to_start)
+    return route_data
+
+def _format_route(routes):
+    """Extract duration and distance from an ORS GeoJSON directions response"""
+    # Extract route details
+    if routes and 'features' in routes and len(routes['features']) > 0:
+        route = routes['features'][0]
+        properties = route['properties']
+        
+        # Calculate duration in hours, minutes, seconds
+        duration_sec = properties['summary']['duration']
+        hours = int(duration_sec // 3600)
+        minutes = int((duration_sec % 3600) // 60)
+        seconds = int(duration_sec % 60)
+        
+        # Calculate distance in kilometers
+        distance_km = properties['summary']['distance'] / 1000
+        
+        return {
+            'route': route,
+            'duration': {
+                'hours': hours,
+                'minutes': minutes,
+                'seconds': seconds,
+                'total_seconds': duration_sec
+            },
+            'distance': {
+                'km': distance_km,
+                'formatted': f"{distance_km:.2f} km"
+            }
+        }
+    else:
+        return {"error": "No route found"}
+
+@asynccontextmanager
+async def _client_session(session=None):
+    """Reuse the caller's aiohttp session, or open a short-lived one"""
+    if session is not None:
+        yield session
+    else:
+        timeout = aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as client:
+            yield client
+
 def get_nearby_cng_stations(latitude, longitude, radius=5000):
     """Get nearby CNG stations (simulated for now, would use actual API in production)"""
     # In a real implementation, this would call an actual CNG station API
@@ -114,17 +322,9 @@ def get_nearby_cng_stations(latitude, longitude, radius=5000):
             distance = R * c
             
             if distance <= radius:
-                nearby_stations.append({
-                    'id': station.id,
-                    'name': station.name,
-                    'latitude': station.latitude,
-                    'longitude': station.longitude,
-                    'address': station.address,
-                    'status': station.status,
-                    'price': station.price,
-                    'operating_hours': station.operating_hours,
-                    'distance': distance
-                })
+                # Reuse the station's cached fields rather than rebuilding them
+                payload = get_station_payload(station)
+                nearby_stations.append(dict(payload.fields, distance=distance))
         
         # Sort by distance
         nearby_stations.sort(key=lambda x: x['distance'])
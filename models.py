@@ -40,15 +40,79 @@ class CNGStation(db.Model):
     status = db.Column(db.String(20), default='operational')  # operational, closed, maintenance
     price = db.Column(db.Float)
     operating_hours = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow, index=True)
     
     # Foreign key to User
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     
+    # Index for bounding-box lookups such as map tiles
+    __table_args__ = (
+        db.Index('ix_cng_station_lat_lng', 'latitude', 'longitude'),
+    )
+    
     def __repr__(self):
         return f'<CNGStation {self.name}>'
 
+# Area a driver watches for station status and price changes
+class StationSubscription(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    radius = db.Column(db.Integer, nullable=False)  # Meters
+    statuses = db.Column(db.String(100))  # Comma-separated statuses to notify on, empty for any
+    price_changes = db.Column(db.Boolean, default=True)
+    webhook_url = db.Column(db.String(500))
+    active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'radius': self.radius,
+            'statuses': self.statuses.split(',') if self.statuses else [],
+            'price_changes': self.price_changes,
+            'webhook_url': self.webhook_url,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<StationSubscription {self.id}>'
+
+# Status or price change of a station, fanned out to subscriptions by station_alerts
+class StationChange(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, db.ForeignKey('cng_station.id'), nullable=False)
+    station_name = db.Column(db.String(100), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    old_status = db.Column(db.String(20))
+    new_status = db.Column(db.String(20))
+    old_price = db.Column(db.Float)
+    new_price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'station_id': self.station_id,
+            'station_name': self.station_name,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'old_status': self.old_status,
+            'new_status': self.new_status,
+            'old_price': self.old_price,
+            'new_price': self.new_price,
+            'changed_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<StationChange {self.id}>'
+
 # Emergency Contact model
 class EmergencyContact(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,16 +134,114 @@ class SOSRequest(db.Model):
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     message = db.Column(db.Text)
-    status = db.Column(db.String(20), default='active')  # active, sent, partial, resolved
+    status = db.Column(db.String(20), default='active')  # active, sent, partial, failed, resolved
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     resolved_at = db.Column(db.DateTime)
     
     # Relationship
     user = db.relationship('User', backref=db.backref('sos_requests', lazy=True))
     
+    # Indexes for per-user history, status lookups and the archival job.
+    # Archived requests keep their id, so SQLite must never hand it out again
+    __table_args__ = (
+        db.Index('ix_sos_request_user_created', 'user_id', 'created_at'),
+        db.Index('ix_sos_request_status_created', 'status', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'message': self.message,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
+        }
+    
     def __repr__(self):
         return f'<SOSRequest {self.id}>'
 
+# Per-user claim on the one SOS request that repeated presses collapse into
+class SOSDedupeWindow(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    sos_request_id = db.Column(db.Integer, db.ForeignKey('sos_request.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<SOSDedupeWindow {self.user_id}>'
+
+# Client-supplied idempotency key of an SOS submission
+class SOSIdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    sos_request_id = db.Column(db.Integer, db.ForeignKey('sos_request.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_sos_idempotency_key_user_key'),
+    )
+    
+    def __repr__(self):
+        return f'<SOSIdempotencyKey {self.key}>'
+
+# Live location track of an SOS request, written in batches by sos_stream
+class SOSLocationUpdate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sos_request_id = db.Column(db.Integer, db.ForeignKey('sos_request.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    accuracy = db.Column(db.Float)  # Meters, as reported by the device
+    recorded_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_sos_location_update_request_recorded', 'sos_request_id', 'recorded_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'accuracy': self.accuracy,
+            'recorded_at': self.recorded_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<SOSLocationUpdate {self.id}>'
+
+# Archived SOS requests, moved out of the hot table by sos_archive
+class SOSRequestArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # Same id as the original SOSRequest
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    message = db.Column(db.Text)
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    resolved_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_sos_request_archive_user_created', 'user_id', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'message': self.message,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+    
+    def __repr__(self):
+        return f'<SOSRequestArchive {self.id}>'
+
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
@@ -1,14 +1,33 @@
 import os
+import json
+import asyncio
 import logging
 import folium
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort, Response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import app, db
-from models import User, CNGStation, EmergencyContact, SOSRequest
-from helpers import get_traffic_data, get_optimal_route, get_nearby_cng_stations, format_duration
-from twilio_service import send_multiple_sos_messages
-from datetime import datetime
+from models import User, CNGStation, EmergencyContact, SOSRequest, SOSRequestArchive, StationSubscription
+from helpers import get_traffic_data_async, get_optimal_route_async, get_multi_stop_route_async, compare_routes_async, get_nearby_cng_stations, format_duration
+from twilio_service import send_multiple_sos_messages_async
+from station_cache import encode_stations, station_popup_html, invalidate_station, dumps
+from admission import admission_controlled
+from station_search import station_index, sync_station_index
+from traffic_history import query_traffic_history, summarize_locations
+from speed_profiles import predict_route_duration
+from tiles import get_tile, valid_tile, TILE_LAYERS
+from db_routing import read_replica, release_connection
+from sos_stream import stream_token, check_stream_token, record_location, latest_location, location_events
+from sos_dedupe import MAX_IDEMPOTENCY_KEY_LENGTH, SOS_SEND_TIMEOUT_SECONDS, submit_sos_request, mark_sos_failed
+from station_alerts import MAX_SUBSCRIPTIONS_PER_USER, subscription_index, validate_subscription, record_station_change, notify_station_change, change_events
+from datetime import datetime, timedelta, timezone
+
+# ORS accepts at most 50 waypoints in one directions request
+MAX_TRIP_STOPS = 50
+
+# Transport modes compared per request, and the colour of each route on the map
+MAX_COMPARE_MODES = 4
+COMPARE_ROUTE_COLORS = ['blue', 'purple', 'darkgreen', 'orange']
 
 # Home page route
 @app.route('/')
@@ -29,16 +48,16 @@ def register():
         if not username or not email or not password:
             flash('All fields are required', 'danger')
             return redirect(url_for('register'))
-            
+        
         if password != confirm_password:
             flash('Passwords do not match', 'danger')
             return redirect(url_for('register'))
-            
+        
         # Check if username or email already exists
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'danger')
             return redirect(url_for('register'))
-            
+        
         if User.query.filter_by(email=email).first():
             flash('Email already exists', 'danger')
             return redirect(url_for('register'))
@@ -100,24 +119,26 @@ def logout():
 
 # User dashboard
 @app.route('/dashboard')
+@read_replica
 @login_required
 def dashboard():
     return render_template('dashboard.html')
 
 # Traffic heatmap
 @app.route('/traffic-heatmap', methods=['POST'])
-def traffic_heatmap():
+@admission_controlled('here')
+async def traffic_heatmap():
     latitude = float(request.form.get('latitude', 40.7128))  # Default to NYC
     longitude = float(request.form.get('longitude', -74.0060))
     
     # Get traffic data
-    traffic_data = get_traffic_data(latitude, longitude)
+    traffic_data = await get_traffic_data_async(latitude, longitude)
     
     # Create a map centered at the given coordinates
     m = folium.Map(location=[latitude, longitude], zoom_start=13)
     
     # Add traffic data to the map (simplified for example)
-    if 'trafficItems' in traffic_data and not isinstance(traffic_data.get('trafficItems'), list):
+    if isinstance(traffic_data.get('trafficItems'), list):
         for item in traffic_data.get('trafficItems', []):
             if 'location' in item:
                 location = item['location']
@@ -150,17 +171,103 @@ def traffic_heatmap():
         'traffic_data': traffic_data
     })
 
+def parse_depart_at(value):
+    """Departure time from an ISO 8601 string (UTC unless an offset is given); now if empty, None if invalid"""
+    if not value:
+        return datetime.now(timezone.utc)
+    try:
+        depart_at = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if depart_at.tzinfo is None:
+        depart_at = depart_at.replace(tzinfo=timezone.utc)
+    return depart_at
+
+# Historical traffic heatmap, served from stored snapshots without upstream calls
+@app.route('/traffic-history', methods=['POST'])
+def traffic_history():
+    latitude = float(request.form.get('latitude', 40.7128))  # Default to NYC
+    longitude = float(request.form.get('longitude', -74.0060))
+    days = min(int(request.form.get('days', 28)), 366)
+    
+    # Optional filters, e.g. weekdays=0,1,2,3,4 with start_time=08:00 and end_time=09:00 (UTC)
+    try:
+        weekdays = request.form.get('weekdays')
+        weekdays = {int(day) for day in weekdays.split(',')} if weekdays else None
+        start_time = request.form.get('start_time')
+        start_time = datetime.strptime(start_time, '%H:%M').time() if start_time else None
+        end_time = request.form.get('end_time')
+        end_time = datetime.strptime(end_time, '%H:%M').time() if end_time else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid weekday or time filter.'
+        })
+    
+    end_date = datetime.utcnow().date()
+    records = query_traffic_history(
+        latitude,
+        longitude,
+        end_date - timedelta(days=days - 1),
+        end_date,
+        weekdays,
+        start_time,
+        end_time
+    )
+    locations = summarize_locations(records)
+    
+    # Create a map centered at the given coordinates
+    m = folium.Map(location=[latitude, longitude], zoom_start=13)
+    
+    for location in locations:
+        severity = location['severity']
+        
+        # Color based on average severity
+        color = 'green'
+        if severity > 3:
+            color = 'red'
+        elif severity > 1:
+            color = 'orange'
+        
+        folium.CircleMarker(
+            location=[location['latitude'], location['longitude']],
+            radius=5 + (severity * 2),
+            color=color,
+            fill=True,
+            fill_color=color,
+            fill_opacity=0.6,
+            popup=f"Average severity {severity:.1f} over {location['samples']} snapshots"
+        ).add_to(m)
+    
+    # Convert map to HTML
+    map_html = m._repr_html_()
+    
+    return jsonify({
+        'success': True,
+        'map_html': map_html,
+        'samples': int(len(records)),
+        'locations': locations
+    })
+
 # Route finder
 @app.route('/find-route', methods=['POST'])
-def find_route():
+@admission_controlled('ors')
+async def find_route():
     start_lat = float(request.form.get('start_lat'))
     start_lng = float(request.form.get('start_lng'))
     end_lat = float(request.form.get('end_lat'))
     end_lng = float(request.form.get('end_lng'))
     transport_mode = request.form.get('transport_mode', 'driving-car')
     
+    depart_at = parse_depart_at(request.form.get('depart_at'))
+    if depart_at is None:
+        return jsonify({
+            'success': False,
+            'error': 'depart_at must be an ISO 8601 date and time.'
+        })
+    
     # Get optimal route
-    route_data = get_optimal_route(
+    route_data = await get_optimal_route_async(
         [start_lng, start_lat],
         [end_lng, end_lat],
         transport_mode
@@ -197,12 +304,214 @@ def find_route():
             for coord in route_geometry['coordinates']:
                 route_coords.append([coord[1], coord[0]])  # Convert to [lat, lng]
     
+    # Adjust ORS's free-flow duration with typical congestion at departure time
+    predicted_duration = predict_route_duration(
+        route_data['route'],
+        route_data['duration']['total_seconds'],
+        depart_at
+    )
+    
     if route_coords:
         folium.PolyLine(
             route_coords,
             color='blue',
             weight=5,
             opacity=0.7,
+            popup=f"Distance: {route_data['distance']['formatted']}, Duration: {format_duration(predicted_duration['total_seconds'])}"
+        ).add_to(m)
+    
+    # Convert map to HTML
+    map_html = m._repr_html_()
+    
+    return jsonify({
+        'success': True,
+        'map_html': map_html,
+        'duration': route_data['duration'],
+        'predicted_duration': predicted_duration,
+        'distance': route_data['distance']
+    })
+
+def requested_transport_modes():
+    """Distinct transport modes asked for by a /compare-routes request"""
+    transport_modes = request.form.get('transport_modes', 'driving-car,cycling-regular,foot-walking')
+    return list(dict.fromkeys(mode.strip() for mode in transport_modes.split(',') if mode.strip()))
+
+def compare_routes_cost():
+    """ORS calls a /compare-routes request makes; invalid requests are charged one"""
+    return min(max(len(requested_transport_modes()), 1), MAX_COMPARE_MODES)
+
+# Compare several transport modes in one request
+@app.route('/compare-routes', methods=['POST'])
+@admission_controlled('ors', cost=compare_routes_cost)
+async def compare_routes():
+    start_lat = float(request.form.get('start_lat'))
+    start_lng = float(request.form.get('start_lng'))
+    end_lat = float(request.form.get('end_lat'))
+    end_lng = float(request.form.get('end_lng'))
+    transport_modes = requested_transport_modes()
+    response_format = request.form.get('format', 'map')
+    
+    if not transport_modes or len(transport_modes) > MAX_COMPARE_MODES:
+        return jsonify({
+            'success': False,
+            'error': f'Between 1 and {MAX_COMPARE_MODES} transport modes are required.'
+        })
+    
+    depart_at = parse_depart_at(request.form.get('depart_at'))
+    if depart_at is None:
+        return jsonify({
+            'success': False,
+            'error': 'depart_at must be an ISO 8601 date and time.'
+        })
+    
+    # All profiles are fetched concurrently, so this takes as long as the slowest
+    routes = await compare_routes_async(
+        [start_lng, start_lat],
+        [end_lng, end_lat],
+        transport_modes
+    )
+    
+    comparison = []
+    for transport_mode, route_data in routes.items():
+        if 'error' in route_data:
+            comparison.append({
+                'transport_mode': transport_mode,
+                'success': False,
+                'error': route_data['error']
+            })
+            continue
+        
+        row = {
+            'transport_mode': transport_mode,
+            'success': True,
+            'duration': route_data['duration'],
+            'distance': route_data['distance']
+        }
+        # Speed profiles come from road traffic, so only driving modes use them
+        if transport_mode.startswith('driving'):
+            row['predicted_duration'] = predict_route_duration(
+                route_data['route'],
+                route_data['duration']['total_seconds'],
+                depart_at
+            )
+        comparison.append(row)
+    
+    if not any(row['success'] for row in comparison):
+        return jsonify({
+            'success': False,
+            'error': 'No route found for any transport mode.',
+            'comparison': comparison
+        })
+    
+    if response_format == 'geojson':
+        features = []
+        for transport_mode, route_data in routes.items():
+            if 'error' not in route_data:
+                feature = dict(route_data['route'])
+                feature['properties'] = dict(feature.get('properties', {}), transport_mode=transport_mode)
+                features.append(feature)
+        return jsonify({
+            'success': True,
+            'comparison': comparison,
+            'routes': {'type': 'FeatureCollection', 'features': features}
+        })
+    
+    # One map with every route overlaid
+    m = folium.Map(location=[(start_lat + end_lat) / 2, (start_lng + end_lng) / 2], zoom_start=10)
+    
+    folium.Marker(
+        [start_lat, start_lng],
+        popup='Start',
+        icon=folium.Icon(color='green', icon='play', prefix='fa')
+    ).add_to(m)
+    
+    folium.Marker(
+        [end_lat, end_lng],
+        popup='End',
+        icon=folium.Icon(color='red', icon='stop', prefix='fa')
+    ).add_to(m)
+    
+    for position, (transport_mode, route_data) in enumerate(routes.items()):
+        if 'error' in route_data:
+            continue
+        route_geometry = route_data['route'].get('geometry', {})
+        if route_geometry.get('type') == 'LineString':
+            folium.PolyLine(
+                [[coord[1], coord[0]] for coord in route_geometry['coordinates']],
+                color=COMPARE_ROUTE_COLORS[position % len(COMPARE_ROUTE_COLORS)],
+                weight=5,
+                opacity=0.7,
+                popup=f"{transport_mode} - Distance: {route_data['distance']['formatted']}, Duration: {format_duration(route_data['duration']['total_seconds'])}"
+            ).add_to(m)
+    
+    # Convert map to HTML
+    map_html = m._repr_html_()
+    
+    return jsonify({
+        'success': True,
+        'map_html': map_html,
+        'comparison': comparison
+    })
+
+# Multi-stop trip optimizer
+@app.route('/optimize-trip', methods=['POST'])
+@admission_controlled('ors', cost=2)
+async def optimize_trip():
+    transport_mode = request.form.get('transport_mode', 'driving-car')
+    return_to_start = request.form.get('return_to_start', 'false').lower() == 'true'
+    time_budget = min(float(request.form.get('time_budget', 0.5)), 2.0)
+    
+    # Stops arrive as a JSON list of [lat, lng] pairs; the first is the start
+    try:
+        stops = [[float(lat), float(lng)] for lat, lng in json.loads(request.form.get('stops', '[]'))]
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Stops must be a JSON list of [latitude, longitude] pairs.'
+        })
+    
+    # A round trip sends the start again as the final waypoint
+    max_stops = MAX_TRIP_STOPS - 1 if return_to_start else MAX_TRIP_STOPS
+    if len(stops) < 2 or len(stops) > max_stops:
+        return jsonify({
+            'success': False,
+            'error': f'Between 2 and {max_stops} stops are required.'
+        })
+    
+    route_data = await get_multi_stop_route_async(
+        [[lng, lat] for lat, lng in stops],
+        transport_mode,
+        return_to_start,
+        time_budget
+    )
+    
+    if 'error' in route_data:
+        return jsonify({
+            'success': False,
+            'error': route_data['error']
+        })
+    
+    # Create a map centred on the stops
+    m = folium.Map(
+        location=[sum(s[0] for s in stops) / len(stops), sum(s[1] for s in stops) / len(stops)],
+        zoom_start=11
+    )
+    
+    # Number the stops in visiting order
+    for position, index in enumerate(route_data['order']):
+        folium.Marker(
+            stops[index],
+            popup=f"Stop {position + 1}" if position else 'Start',
+            icon=folium.Icon(color='green' if position == 0 else 'blue', icon='map-marker', prefix='fa')
+        ).add_to(m)
+    
+    route_geometry = route_data['route'].get('geometry', {})
+    if route_geometry.get('type') == 'LineString':
+        folium.PolyLine(
+            [[coord[1], coord[0]] for coord in route_geometry['coordinates']],
+            color='blue',
+            weight=5,
+            opacity=0.7,
             popup=f"Distance: {route_data['distance']['formatted']}, Duration: {format_duration(route_data['duration']['total_seconds'])}"
         ).add_to(m)
     
@@ -212,6 +521,8 @@ def find_route():
     return jsonify({
         'success': True,
         'map_html': map_html,
+        'order': route_data['order'],
+        'ordered_stops': [stops[index] for index in route_data['order']],
         'duration': route_data['duration'],
         'distance': route_data['distance']
     })
@@ -223,6 +534,7 @@ def cng_stations():
 
 # API endpoint to get nearby CNG stations
 @app.route('/api/nearby-cng-stations', methods=['POST'])
+@read_replica
 def api_nearby_cng_stations():
     latitude = float(request.form.get('latitude'))
     longitude = float(request.form.get('longitude'))
@@ -255,15 +567,8 @@ def api_nearby_cng_stations():
         elif station['status'] == 'maintenance':
             color = 'orange'
         
-        # Format popup content
-        popup_content = f"""
-        <strong>{station['name']}</strong><br>
-        Status: {station['status']}<br>
-        Price: ₹{station['price']:.2f}/kg<br>
-        Address: {station['address']}<br>
-        Hours: {station['operating_hours']}<br>
-        Distance: {station['distance']:.2f} meters
-        """
+        # Popup content comes from the station's cached markup
+        popup_content = station_popup_html(station)
         
         folium.Marker(
             [station['latitude'], station['longitude']],
@@ -274,14 +579,68 @@ def api_nearby_cng_stations():
     # Convert map to HTML
     map_html = m._repr_html_()
     
+    # Assemble the response from pre-serialized station fragments
+    body = f'{{"success":true,"map_html":{dumps(map_html)},"stations":{encode_stations(stations)}}}'
+    return app.response_class(body, mimetype='application/json')
+
+# Station search and autocomplete by name and address
+@app.route('/api/search-stations')
+@read_replica
+def api_search_stations():
+    query = request.args.get('q', '').strip()
+    latitude = request.args.get('latitude', type=float)
+    longitude = request.args.get('longitude', type=float)
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': 'A search query is required.'
+        })
+    
+    try:
+        sync_station_index()
+    except Exception as e:
+        logging.error(f"Error loading station search index: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        })
+    
     return jsonify({
         'success': True,
-        'map_html': map_html,
-        'stations': stations
+        'stations': station_index.search(query, latitude, longitude, limit)
     })
 
+# Map tiles for the station and traffic layers
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>')
+@read_replica
+def map_tile(layer, z, x, y):
+    if layer not in TILE_LAYERS or not valid_tile(z, x, y):
+        return jsonify({
+            'success': False,
+            'error': 'Unknown tile.'
+        }), 404
+    
+    try:
+        payload, version = get_tile(layer, z, x, y)
+    except Exception as e:
+        logging.error(f"Error rendering {layer} tile {z}/{x}/{y}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        }), 500
+    
+    # Clients revalidate with the ETag, which changes whenever the layer's data does
+    response = app.response_class(payload, mimetype='application/json')
+    response.set_etag(f"{layer}-{version}-{z}-{x}-{y}")
+    response.cache_control.public = True
+    response.cache_control.max_age = 30
+    return response.make_conditional(request)
+
 # Owner dashboard
 @app.route('/owner-dashboard')
+@read_replica
 @login_required
 def owner_dashboard():
     if not current_user.is_owner():
@@ -333,6 +692,7 @@ def add_station():
     try:
         db.session.add(new_station)
         db.session.commit()
+        station_index.upsert(new_station)
         return jsonify({
             'success': True,
             'station_id': new_station.id,
@@ -373,14 +733,22 @@ def update_station(station_id):
         })
     
     # Update station details
+    old_status, old_price = station.status, station.price
     station.name = request.form.get('name', station.name)
     station.status = request.form.get('status', station.status)
     station.price = float(request.form.get('price', station.price))
     station.operating_hours = request.form.get('operating_hours', station.operating_hours)
     station.updated_at = datetime.utcnow()
     
+    # Status and price changes are pushed to subscribers once committed
+    change = record_station_change(station, old_status, old_price)
+    
     try:
         db.session.commit()
+        invalidate_station(station.id)
+        station_index.upsert(station)
+        if change is not None:
+            notify_station_change(change)
         return jsonify({
             'success': True,
             'message': 'Station updated successfully!'
@@ -393,8 +761,124 @@ def update_station(station_id):
             'error': f'An error occurred: {str(e)}'
         })
 
+# Station change subscriptions of the current user
+@app.route('/api/station-subscriptions')
+@read_replica
+@login_required
+def api_station_subscriptions():
+    subscriptions = StationSubscription.query.filter_by(user_id=current_user.id, active=True).all()
+    return jsonify({
+        'success': True,
+        'subscriptions': [subscription.to_dict() for subscription in subscriptions]
+    })
+
+# Watch an area for station status and price changes
+@app.route('/api/station-subscriptions', methods=['POST'])
+@login_required
+def add_station_subscription():
+    try:
+        latitude = float(request.form.get('latitude'))
+        longitude = float(request.form.get('longitude'))
+        radius = int(request.form.get('radius', 5000))
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Latitude, longitude and radius must be numbers'
+        }), 400
+    
+    statuses = [status.strip() for status in request.form.get('statuses', '').split(',') if status.strip()]
+    price_changes = request.form.get('price_changes', 'true').lower() == 'true'
+    webhook_url = request.form.get('webhook_url') or None
+    
+    error = validate_subscription(latitude, longitude, radius, statuses, webhook_url)
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+    
+    if StationSubscription.query.filter_by(user_id=current_user.id, active=True).count() >= MAX_SUBSCRIPTIONS_PER_USER:
+        return jsonify({
+            'success': False,
+            'error': f'At most {MAX_SUBSCRIPTIONS_PER_USER} subscriptions are allowed.'
+        }), 400
+    
+    subscription = StationSubscription(
+        user_id=current_user.id,
+        latitude=latitude,
+        longitude=longitude,
+        radius=radius,
+        statuses=','.join(statuses) or None,
+        price_changes=price_changes,
+        webhook_url=webhook_url
+    )
+    
+    try:
+        db.session.add(subscription)
+        db.session.commit()
+        subscription_index.upsert(subscription)
+        return jsonify({
+            'success': True,
+            'subscription': subscription.to_dict(),
+            'stream_url': url_for('station_subscription_stream', subscription_id=subscription.id, _external=True)
+        })
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error adding station subscription: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        })
+
+# Cancel a station change subscription
+@app.route('/api/station-subscriptions/<int:subscription_id>', methods=['DELETE'])
+@login_required
+def delete_station_subscription(subscription_id):
+    subscription = StationSubscription.query.get(subscription_id)
+    
+    if not subscription or subscription.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'error': 'Subscription not found.'
+        }), 404
+    
+    try:
+        subscription.active = False
+        db.session.commit()
+        subscription_index.remove(subscription.id)
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error cancelling station subscription: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'An error occurred: {str(e)}'
+        })
+
+# Server-sent event stream of the changes matching a subscription
+@app.route('/api/station-subscriptions/<int:subscription_id>/stream')
+@login_required
+def station_subscription_stream(subscription_id):
+    subscription = StationSubscription.query.get(subscription_id)
+    
+    if not subscription or not subscription.active or subscription.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'error': 'Subscription not found.'
+        }), 404
+    
+    # Browsers send the id of the last event they saw when reconnecting
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    
+    return Response(
+        change_events(subscription_id, last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # SOS page
 @app.route('/sos')
+@read_replica
 @login_required
 def sos():
     # Get user's emergency contacts
@@ -440,10 +924,10 @@ def add_emergency_contact():
             'error': f'An error occurred: {str(e)}'
         })
 
-# Send SOS alert
+# Send SOS alert (never admission-controlled: alerts must not be shed)
 @app.route('/send-sos', methods=['POST'])
 @login_required
-def send_sos():
+async def send_sos():
     latitude = float(request.form.get('latitude'))
     longitude = float(request.form.get('longitude'))
     message = request.form.get('message', '')
@@ -457,31 +941,62 @@ def send_sos():
             'error': 'No emergency contacts found. Please add at least one contact.'
         })
     
-    # Create SOS request record
-    sos_request = SOSRequest(
-        user_id=current_user.id,
-        latitude=latitude,
-        longitude=longitude,
-        message=message,
-        status='active'
-    )
+    # Retries of one submission carry the same key, from the header or the form
+    idempotency_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return jsonify({
+            'success': False,
+            'error': f'Idempotency key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters.'
+        }), 400
     
+    sos_request, created = None, False
     try:
-        db.session.add(sos_request)
-        db.session.commit()
+        # Create the SOS request record, unless this press repeats an active one
+        sos_request, created = submit_sos_request(
+            current_user.id,
+            latitude,
+            longitude,
+            message,
+            idempotency_key
+        )
+        
+        # Contacts get a link that follows the live location
+        token = stream_token(sos_request)
+        live_url = url_for('sos_live_location', sos_request_id=sos_request.id, token=token, _external=True)
+        stream_url = url_for('sos_location_stream', sos_request_id=sos_request.id, token=token, _external=True)
+        
+        if not created:
+            # Contacts were already alerted; only the location and message were updated
+            return jsonify({
+                'success': True,
+                'duplicate': True,
+                'message': 'SOS alert already in progress. Your location has been updated.',
+                'sos_request_id': sos_request.id,
+                'status': sos_request.status,
+                'live_url': live_url,
+                'stream_url': stream_url
+            })
         
         # Log emergency contacts before sending
         logging.info(f"Sending SOS to {len(contacts)} contacts for user {current_user.username}")
         for contact in contacts:
             logging.info(f"Contact: {contact.name}, Phone: {contact.phone}")
         
-        # Send SOS messages to all contacts
-        result = send_multiple_sos_messages(
-            contacts,
-            current_user.username,
-            latitude,
-            longitude,
-            message
+        # Twilio can take seconds; do not hold a database connection meanwhile
+        release_connection()
+        
+        # Send SOS messages to all contacts; a send still running after the
+        # timeout is abandoned, so later presses may send again
+        result = await asyncio.wait_for(
+            send_multiple_sos_messages_async(
+                contacts,
+                current_user.username,
+                latitude,
+                longitude,
+                message,
+                live_url=live_url
+            ),
+            SOS_SEND_TIMEOUT_SECONDS
         )
         
         # Update SOS request status in DB based on result
@@ -491,6 +1006,9 @@ def send_sos():
             return jsonify({
                 'success': True,
                 'message': 'SOS alerts sent successfully!',
+                'sos_request_id': sos_request.id,
+                'live_url': live_url,
+                'stream_url': stream_url,
                 'results': result['results']
             })
         else:
@@ -501,16 +1019,120 @@ def send_sos():
             return jsonify({
                 'success': False,
                 'error': 'Some SOS alerts failed to send.',
+                'sos_request_id': sos_request.id,
+                'live_url': live_url,
+                'stream_url': stream_url,
                 'results': result['results']
             })
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error processing SOS request: {str(e)}")
+        
+        # Free the dedupe window, or every later press would join an SOS that was never sent
+        if created:
+            mark_sos_failed(sos_request.id)
         return jsonify({
             'success': False,
             'error': f'An error occurred: {str(e)}'
         })
 
+# Live location updates from the device that raised an SOS
+@app.route('/sos/<int:sos_request_id>/location', methods=['POST'])
+@login_required
+def update_sos_location(sos_request_id):
+    sos_request = SOSRequest.query.get(sos_request_id)
+    
+    if not sos_request or sos_request.user_id != current_user.id:
+        return jsonify({
+            'success': False,
+            'error': 'SOS request not found.'
+        }), 404
+    
+    if sos_request.status == 'resolved':
+        return jsonify({
+            'success': False,
+            'error': 'This SOS request has been resolved.'
+        }), 410
+    
+    try:
+        latitude = float(request.form.get('latitude'))
+        longitude = float(request.form.get('longitude'))
+        accuracy = request.form.get('accuracy', type=float)
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'error': 'Latitude and longitude are required'
+        }), 400
+    
+    # Written to the database in batches; only queued here
+    event = record_location(sos_request_id, latitude, longitude, accuracy)
+    return jsonify({'success': True, 'location': event})
+
+def _sos_request_for_viewer(sos_request_id):
+    """SOS request visible to its owner, or to anyone holding its stream token until it is resolved"""
+    sos_request = SOSRequest.query.get(sos_request_id)
+    if not sos_request:
+        abort(404)
+    
+    token = request.args.get('token', '')
+    is_owner = current_user.is_authenticated and sos_request.user_id == current_user.id
+    if not is_owner and not check_stream_token(sos_request, token):
+        abort(404)
+    return sos_request
+
+# Server-sent event stream of an SOS request's location
+@app.route('/sos/<int:sos_request_id>/stream')
+def sos_location_stream(sos_request_id):
+    sos_request = _sos_request_for_viewer(sos_request_id)
+    if sos_request.status == 'resolved':
+        return jsonify({
+            'success': False,
+            'error': 'This SOS request has been resolved.'
+        }), 410
+    initial = latest_location(sos_request)
+    
+    return Response(
+        location_events(sos_request_id, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Link sent to emergency contacts: opens the latest known location
+@app.route('/sos/<int:sos_request_id>/live')
+def sos_live_location(sos_request_id):
+    sos_request = _sos_request_for_viewer(sos_request_id)
+    location = latest_location(sos_request)
+    return redirect(f"https://maps.google.com/?q={location['latitude']},{location['longitude']}")
+
+# Paginated SOS history for the current user
+@app.route('/api/sos-history')
+@read_replica
+@login_required
+def api_sos_history():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    archived = request.args.get('archived', 'false').lower() == 'true'
+    
+    # Archived requests live in their own table once the archival job runs
+    model = SOSRequestArchive if archived else SOSRequest
+    pagination = db.paginate(
+        db.select(model)
+        .filter_by(user_id=current_user.id)
+        .order_by(model.created_at.desc(), model.id.desc()),
+        page=page,
+        per_page=per_page,
+        error_out=False
+    )
+    
+    return jsonify({
+        'success': True,
+        'requests': [sos_request.to_dict() for sos_request in pagination.items],
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages
+    })
+
 # Error handlers
 @app.errorhandler(404)
 def page_not_found(e):
@@ -0,0 +1,82 @@
+import os
+import time
+import logging
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, literal, or_, and_
+from app import app, db
+from models import SOSRequest, SOSRequestArchive, SOSLocationUpdate, SOSDedupeWindow, SOSIdempotencyKey
+
+# Archival settings from environment
+SOS_ARCHIVE_AFTER_DAYS = int(os.environ.get("SOS_ARCHIVE_AFTER_DAYS", 30))
+SOS_RESOLVED_ARCHIVE_AFTER_HOURS = int(os.environ.get("SOS_RESOLVED_ARCHIVE_AFTER_HOURS", 24))
+SOS_ARCHIVE_BATCH_SIZE = int(os.environ.get("SOS_ARCHIVE_BATCH_SIZE", 500))
+
+# Columns copied verbatim from SOSRequest to SOSRequestArchive
+ARCHIVED_COLUMNS = ['id', 'user_id', 'latitude', 'longitude', 'message', 'status', 'created_at', 'resolved_at']
+
+def archive_sos_requests(batch_size=SOS_ARCHIVE_BATCH_SIZE, now=None):
+    """
+    Move resolved and old SOS requests into the archive table
+    
+    Requests resolved more than SOS_RESOLVED_ARCHIVE_AFTER_HOURS ago, and any
+    request created more than SOS_ARCHIVE_AFTER_DAYS ago, are copied to
+    SOSRequestArchive and deleted from SOSRequest, one batch per transaction.
+    
+    Returns:
+        int: Number of requests archived
+    """
+    now = now or datetime.utcnow()
+    resolved_cutoff = now - timedelta(hours=SOS_RESOLVED_ARCHIVE_AFTER_HOURS)
+    age_cutoff = now - timedelta(days=SOS_ARCHIVE_AFTER_DAYS)
+    
+    archivable = or_(
+        and_(SOSRequest.status == 'resolved', SOSRequest.resolved_at < resolved_cutoff),
+        SOSRequest.created_at < age_cutoff
+    )
+    
+    archived = 0
+    while True:
+        ids = db.session.scalars(
+            select(SOSRequest.id).where(archivable).order_by(SOSRequest.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        
+        try:
+            source_columns = [getattr(SOSRequest, name) for name in ARCHIVED_COLUMNS]
+            db.session.execute(
+                insert(SOSRequestArchive).from_select(
+                    ARCHIVED_COLUMNS + ['archived_at'],
+                    select(*source_columns, literal(now)).where(SOSRequest.id.in_(ids))
+                )
+            )
+            # The live location track and deduplication records are not kept once a request is archived
+            db.session.execute(delete(SOSLocationUpdate).where(SOSLocationUpdate.sos_request_id.in_(ids)))
+            db.session.execute(delete(SOSIdempotencyKey).where(SOSIdempotencyKey.sos_request_id.in_(ids)))
+            db.session.execute(delete(SOSDedupeWindow).where(SOSDedupeWindow.sos_request_id.in_(ids)))
+            db.session.execute(delete(SOSRequest).where(SOSRequest.id.in_(ids)))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error archiving SOS requests: {str(e)}")
+            raise
+        
+        archived += len(ids)
+        logging.info(f"Archived {len(ids)} SOS requests ({archived} so far)")
+    
+    return archived
+
+@app.cli.command('archive-sos')
+@click.option('--batch-size', default=SOS_ARCHIVE_BATCH_SIZE, show_default=True,
+              help='Requests moved per transaction.')
+@click.option('--interval', default=0, show_default=True,
+              help='Keep running, archiving every INTERVAL seconds.')
+def archive_sos_command(batch_size, interval):
+    """Move resolved and old SOS requests to the archive table."""
+    while True:
+        archived = archive_sos_requests(batch_size)
+        click.echo(f"Archived {archived} SOS requests")
+        if not interval:
+            break
+        time.sleep(interval)
@@ -0,0 +1,164 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, or_, and_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import SOSRequest, SOSDedupeWindow, SOSIdempotencyKey
+from sos_stream import record_location
+
+# Seconds after an SOS (or its latest repeat) during which new presses collapse into it
+SOS_DEDUPE_WINDOW_SECONDS = int(os.environ.get("SOS_DEDUPE_WINDOW_SECONDS", 120))
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 100
+
+# Seconds the alerts of one SOS may take to send; send_sos gives up after this
+SOS_SEND_TIMEOUT_SECONDS = int(os.environ.get("SOS_SEND_TIMEOUT_SECONDS", 60))
+
+# A repeat press starts a fresh SOS when the active one is over or failed to reach everyone
+RESENDABLE_STATUSES = ('partial', 'failed', 'resolved')
+
+def submit_sos_request(user_id, latitude, longitude, message, idempotency_key=None, now=None):
+    """
+    Create an SOS request, or collapse a repeated submission into the active one
+    
+    A submission reusing an idempotency key returns the request that key
+    created. Otherwise the user's SOSDedupeWindow row decides: whoever
+    claims it, by inserting it or by taking it over once expired, creates
+    the new request; everyone else within SOS_DEDUPE_WINDOW_SECONDS joins
+    the active request. The claim is a single conditional UPDATE or a
+    primary-key INSERT, so concurrent presses handled by different worker
+    processes still produce exactly one request. A request still 'active'
+    after SOS_SEND_TIMEOUT_SECONDS was abandoned mid-send, e.g. by a crashed
+    worker, and is replaced like a failed one.
+    
+    Returns:
+        tuple: (sos_request, created) where created is False for a repeat
+    """
+    now = now or datetime.utcnow()
+    expires_at = now + timedelta(seconds=SOS_DEDUPE_WINDOW_SECONDS)
+    
+    if idempotency_key:
+        sos_request = _request_for_key(user_id, idempotency_key)
+        if sos_request is not None and not is_resendable(sos_request, now):
+            _join_request(sos_request, latitude, longitude, message, expires_at)
+            return sos_request, False
+    
+    sos_request = SOSRequest(
+        user_id=user_id,
+        latitude=latitude,
+        longitude=longitude,
+        message=message,
+        status='active',
+        created_at=now
+    )
+    
+    try:
+        db.session.add(sos_request)
+        db.session.flush()
+        _claim_window(user_id, sos_request.id, now, expires_at)
+        if idempotency_key:
+            # A retry of a failed submission moves its key to the new request
+            db.session.execute(
+                delete(SOSIdempotencyKey)
+                .where(SOSIdempotencyKey.user_id == user_id, SOSIdempotencyKey.key == idempotency_key)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.add(SOSIdempotencyKey(user_id=user_id, key=idempotency_key, sos_request_id=sos_request.id))
+        db.session.commit()
+        return sos_request, True
+    except IntegrityError:
+        # Another press, possibly in another worker, holds the active request
+        db.session.rollback()
+    
+    window = db.session.get(SOSDedupeWindow, user_id)
+    sos_request = db.session.get(SOSRequest, window.sos_request_id)
+    if idempotency_key:
+        _remember_key(user_id, idempotency_key, sos_request.id)
+    _join_request(sos_request, latitude, longitude, message, expires_at)
+    return sos_request, False
+
+def _claim_window(user_id, sos_request_id, now, expires_at):
+    """Make sos_request_id the user's active request; IntegrityError if another one still is"""
+    result = db.session.execute(
+        update(SOSDedupeWindow)
+        .where(SOSDedupeWindow.user_id == user_id)
+        .where(or_(
+            SOSDedupeWindow.expires_at < now,
+            SOSDedupeWindow.sos_request_id.in_(
+                select(SOSRequest.id).where(_resendable_clause(now))
+            )
+        ))
+        .values(sos_request_id=sos_request_id, expires_at=expires_at)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+    
+    # First SOS of this user; a concurrent or still-active claim makes this fail
+    db.session.add(SOSDedupeWindow(user_id=user_id, sos_request_id=sos_request_id, expires_at=expires_at))
+    db.session.flush()
+
+def is_resendable(sos_request, now=None):
+    """Whether a new press should send a fresh SOS instead of joining this one"""
+    now = now or datetime.utcnow()
+    if sos_request.status in RESENDABLE_STATUSES:
+        return True
+    stalled_before = now - timedelta(seconds=SOS_SEND_TIMEOUT_SECONDS)
+    return sos_request.status == 'active' and sos_request.created_at < stalled_before
+
+def _resendable_clause(now):
+    stalled_before = now - timedelta(seconds=SOS_SEND_TIMEOUT_SECONDS)
+    return or_(
+        SOSRequest.status.in_(RESENDABLE_STATUSES),
+        and_(SOSRequest.status == 'active', SOSRequest.created_at < stalled_before)
+    )
+
+def mark_sos_failed(sos_request_id):
+    """Record that an SOS could not be sent, so the next press sends it again"""
+    try:
+        db.session.execute(
+            update(SOSRequest)
+            .where(SOSRequest.id == sos_request_id, SOSRequest.status == 'active')
+            .values(status='failed')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error marking SOS request {sos_request_id} as failed: {str(e)}")
+
+def _request_for_key(user_id, idempotency_key):
+    return db.session.scalars(
+        select(SOSRequest)
+        .join(SOSIdempotencyKey, SOSIdempotencyKey.sos_request_id == SOSRequest.id)
+        .where(SOSIdempotencyKey.user_id == user_id, SOSIdempotencyKey.key == idempotency_key)
+    ).first()
+
+def _remember_key(user_id, idempotency_key, sos_request_id):
+    try:
+        db.session.add(SOSIdempotencyKey(user_id=user_id, key=idempotency_key, sos_request_id=sos_request_id))
+        db.session.commit()
+    except IntegrityError:
+        # The same key was recorded concurrently; it points at the same request
+        db.session.rollback()
+
+def _join_request(sos_request, latitude, longitude, message, expires_at):
+    """Fold a repeated press into the active request without sending anything"""
+    try:
+        if message and message != sos_request.message:
+            sos_request.message = message
+        db.session.execute(
+            update(SOSDedupeWindow)
+            .where(SOSDedupeWindow.user_id == sos_request.user_id)
+            .where(SOSDedupeWindow.sos_request_id == sos_request.id)
+            .values(expires_at=expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error updating SOS request {sos_request.id} from a repeated submission: {str(e)}")
+    
+    # The new position reaches the request and its live viewers like any location update
+    record_location(sos_request.id, latitude, longitude)
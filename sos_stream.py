@@ -0,0 +1,299 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import insert, update, select
+from sqlalchemy.exc import IntegrityError
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app import app, db
+from models import SOSRequest, SOSLocationUpdate
+
+# Streaming settings from environment
+LOCATION_FLUSH_SECONDS = float(os.environ.get("LOCATION_FLUSH_SECONDS", 2))
+LOCATION_FLUSH_BATCH = int(os.environ.get("LOCATION_FLUSH_BATCH", 200))
+LOCATION_BUFFER_LIMIT = int(os.environ.get("LOCATION_BUFFER_LIMIT", 50000))
+STREAM_POLL_SECONDS = float(os.environ.get("STREAM_POLL_SECONDS", 5))
+STREAM_TOKEN_MAX_AGE = int(os.environ.get("STREAM_TOKEN_MAX_AGE", 24 * 3600))
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Updates queued per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_serializer = URLSafeTimedSerializer(app.secret_key, salt='sos-stream')
+
+def stream_token(sos_request):
+    """Token that lets someone without an account follow one SOS request for STREAM_TOKEN_MAX_AGE seconds"""
+    return _serializer.dumps(_token_claims(sos_request))
+
+def check_stream_token(sos_request, token):
+    """
+    Whether token was issued for this very request and may still be used
+    
+    The token names the request's id, owner and creation time, so it cannot
+    follow a different request that later reuses the id. It stops working
+    once the request is resolved, even before STREAM_TOKEN_MAX_AGE.
+    """
+    if sos_request.status == 'resolved':
+        return False
+    try:
+        return _serializer.loads(token, max_age=STREAM_TOKEN_MAX_AGE) == _token_claims(sos_request)
+    except BadSignature:
+        return False
+
+def _token_claims(sos_request):
+    created_at = sos_request.created_at.isoformat() if sos_request.created_at else None
+    return [sos_request.id, sos_request.user_id, created_at]
+
+class LocationBuffer:
+    """
+    Write-behind buffer for location updates
+    
+    Updates are held in memory and inserted in batches by a background
+    thread every LOCATION_FLUSH_SECONDS, or sooner once LOCATION_FLUSH_BATCH
+    are waiting. Each batch also moves the SOS request's own latitude and
+    longitude to its latest position.
+    """
+    
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+    
+    def add(self, update):
+        with self._lock:
+            if len(self._pending) >= LOCATION_BUFFER_LIMIT:
+                # Database unreachable for a long time: keep the newest updates
+                self._pending.pop(0)
+            self._pending.append(update)
+            pending = len(self._pending)
+        
+        self._ensure_thread()
+        if pending >= LOCATION_FLUSH_BATCH:
+            self._wake.set()
+    
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        
+        try:
+            self._write(batch)
+            return len(batch)
+        except IntegrityError as e:
+            logging.error(f"Error writing {len(batch)} SOS location updates, retrying one at a time: {str(e)}")
+        except Exception as e:
+            logging.error(f"Error writing {len(batch)} SOS location updates: {str(e)}")
+            self._requeue(batch)
+            return 0
+        
+        # One bad row, such as an update for a request archived meanwhile,
+        # would otherwise fail every retry of the batch
+        written = 0
+        for position, row in enumerate(batch):
+            try:
+                self._write([row])
+                written += 1
+            except IntegrityError as e:
+                logging.error(f"Dropping location update for SOS request {row['sos_request_id']}: {str(e)}")
+            except Exception as e:
+                logging.error(f"Error writing {len(batch) - position} SOS location updates: {str(e)}")
+                self._requeue(batch[position:])
+                break
+        return written
+    
+    def _write(self, batch):
+        with app.app_context():
+            db.session.execute(insert(SOSLocationUpdate), batch)
+            
+            latest = {}
+            for row in batch:
+                latest[row['sos_request_id']] = row
+            for sos_request_id, row in latest.items():
+                db.session.execute(
+                    update(SOSRequest)
+                    .where(SOSRequest.id == sos_request_id)
+                    .values(latitude=row['latitude'], longitude=row['longitude'])
+                )
+            db.session.commit()
+    
+    def _requeue(self, batch):
+        """Put unwritten updates back in front of anything buffered since"""
+        with self._lock:
+            self._pending = (batch + self._pending)[-LOCATION_BUFFER_LIMIT:]
+    
+    def latest_pending(self, sos_request_id):
+        """Newest buffered update for an SOS request, if any"""
+        with self._lock:
+            for row in reversed(self._pending):
+                if row['sos_request_id'] == sos_request_id:
+                    return row
+        return None
+    
+    def _ensure_thread(self):
+        # Threads do not survive fork, so each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='sos-location-writer', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(LOCATION_FLUSH_SECONDS)
+            self._wake.clear()
+            self.flush()
+
+class EventBroker:
+    """
+    Fan-out of events to the subscribers in this worker, keyed by an id
+    
+    Publishing never waits: each subscriber has a bounded queue, and a
+    subscriber that falls behind loses its oldest updates instead of
+    holding up the sender.
+    """
+    
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+    
+    def subscribe(self, key):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, key, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[key]
+    
+    def publish(self, key, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    pass
+
+location_buffer = LocationBuffer()
+location_broker = EventBroker()
+atexit.register(location_buffer.flush)
+
+def record_location(sos_request_id, latitude, longitude, accuracy=None):
+    """Queue a position for writing and push it to live subscribers"""
+    recorded_at = datetime.utcnow()
+    location_buffer.add({
+        'sos_request_id': sos_request_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': accuracy,
+        'recorded_at': recorded_at
+    })
+    
+    event = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': accuracy,
+        'recorded_at': recorded_at.isoformat()
+    }
+    location_broker.publish(sos_request_id, event)
+    return event
+
+def latest_location(sos_request):
+    """Most recent known position, including updates not yet written"""
+    row = location_buffer.latest_pending(sos_request.id)
+    if row is not None:
+        return {
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'accuracy': row['accuracy'],
+            'recorded_at': row['recorded_at'].isoformat()
+        }
+    
+    track_point = db.session.scalars(
+        select(SOSLocationUpdate)
+        .where(SOSLocationUpdate.sos_request_id == sos_request.id)
+        .order_by(SOSLocationUpdate.recorded_at.desc())
+        .limit(1)
+    ).first()
+    if track_point is not None:
+        return track_point.to_dict()
+    
+    return {
+        'latitude': sos_request.latitude,
+        'longitude': sos_request.longitude,
+        'accuracy': None,
+        'recorded_at': sos_request.created_at.isoformat() if sos_request.created_at else None
+    }
+
+def location_events(sos_request_id, initial):
+    """
+    Server-sent events for one SOS request
+    
+    Updates received by this worker arrive immediately through the broker.
+    Updates received by other workers are picked up from the track table
+    every STREAM_POLL_SECONDS once they have been written. The stream ends
+    once the request is resolved or no longer exists.
+    """
+    subscriber = location_broker.subscribe(sos_request_id)
+    last_seen = initial.get('recorded_at') or ''
+    
+    try:
+        yield _sse(initial)
+        waited = 0
+        while True:
+            try:
+                event = subscriber.get(timeout=STREAM_POLL_SECONDS)
+                if event['recorded_at'] > last_seen:
+                    last_seen = event['recorded_at']
+                    yield _sse(event)
+            except queue.Empty:
+                events, status = _written_since(sos_request_id, last_seen)
+                for event in events:
+                    last_seen = event['recorded_at']
+                    yield _sse(event)
+                if status is None or status == 'resolved':
+                    yield f"event: resolved\ndata: {json.dumps({'status': status})}\n\n"
+                    return
+                
+                waited += STREAM_POLL_SECONDS
+                if waited >= STREAM_KEEPALIVE_SECONDS:
+                    waited = 0
+                    yield ": keepalive\n\n"
+    finally:
+        location_broker.unsubscribe(sos_request_id, subscriber)
+
+def _written_since(sos_request_id, last_seen):
+    """Track points written after last_seen, and the request's current status"""
+    with app.app_context():
+        status = db.session.scalar(select(SOSRequest.status).where(SOSRequest.id == sos_request_id))
+        query = select(SOSLocationUpdate).where(SOSLocationUpdate.sos_request_id == sos_request_id)
+        if last_seen:
+            query = query.where(SOSLocationUpdate.recorded_at > datetime.fromisoformat(last_seen))
+        rows = db.session.scalars(query.order_by(SOSLocationUpdate.recorded_at)).all()
+        return [row.to_dict() for row in rows], status
+
+def _sse(event):
+    return f"event: location\ndata: {json.dumps(event)}\n\n"
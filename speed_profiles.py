@@ -0,0 +1,192 @@
+import os
+import time
+import logging
+import click
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from app import app
+from traffic_history import TRAFFIC_HISTORY_DIR, RECORD_DTYPE, AREA_DEGREES, day_path
+
+# Speed profile settings from environment
+SPEED_PROFILE_PATH = os.environ.get("SPEED_PROFILE_PATH", os.path.join(TRAFFIC_HISTORY_DIR, "speed_profiles.npz"))
+SPEED_PROFILE_DAYS = int(os.environ.get("SPEED_PROFILE_DAYS", 56))
+
+# Profiles hold one congestion factor per area per 15-minute slot of the week (UTC)
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+BUCKETS_PER_WEEK = 7 * BUCKETS_PER_DAY
+
+# Extra travel time per point of average severity (half the HERE jam factor)
+SEVERITY_SLOWDOWN = 0.15
+
+# Slots with fewer snapshots than this keep the free-flow factor of 1
+MIN_SAMPLES = 3
+
+# How often workers look for a rebuilt profile file
+RELOAD_CHECK_SECONDS = 60
+
+def build_speed_profiles(start_date, end_date, path=SPEED_PROFILE_PATH):
+    """
+    Build congestion factors per area and time slot from stored traffic snapshots
+    
+    Returns:
+        int: Number of areas with a profile
+    """
+    areas, buckets, severities = [], [], []
+    day = start_date
+    while day <= end_date:
+        history_path = day_path(day)
+        if os.path.exists(history_path) and os.path.getsize(history_path) >= RECORD_DTYPE.itemsize:
+            count = os.path.getsize(history_path) // RECORD_DTYPE.itemsize
+            records = np.memmap(history_path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+            areas.append(np.array(records['area']))
+            buckets.append(_week_buckets(records['timestamp'].astype(np.int64)))
+            severities.append(np.array(records['severity'], dtype=np.float64))
+            del records
+        day += timedelta(days=1)
+    
+    if not areas:
+        logging.info("No traffic history to build speed profiles from")
+        return 0
+    
+    area_ids, area_index = np.unique(np.concatenate(areas), return_inverse=True)
+    slots = area_index.reshape(-1) * BUCKETS_PER_WEEK + np.concatenate(buckets)
+    size = len(area_ids) * BUCKETS_PER_WEEK
+    samples = np.bincount(slots, minlength=size)
+    totals = np.bincount(slots, weights=np.concatenate(severities), minlength=size)
+    
+    mean_severity = np.divide(totals, samples, out=np.zeros(size), where=samples > 0)
+    factors = np.where(samples >= MIN_SAMPLES, 1 + SEVERITY_SLOWDOWN * mean_severity, 1.0)
+    
+    # Write then rename so workers never load a half-written file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = path + '.tmp.npz'
+    np.savez(temporary_path, areas=area_ids.astype('<i4'),
+             factors=factors.reshape(len(area_ids), BUCKETS_PER_WEEK).astype('<f2'))
+    os.replace(temporary_path, path)
+    
+    return len(area_ids)
+
+class SpeedProfiles:
+    """Congestion factor lookup table loaded from a built profile file"""
+    
+    def __init__(self, areas, factors):
+        self.areas = areas
+        self.factors = factors
+    
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['areas'], data['factors'].astype(np.float32))
+    
+    def lookup(self, areas, buckets):
+        """Factors for parallel arrays of area ids and week buckets; 1 where unknown"""
+        positions = np.searchsorted(self.areas, areas)
+        positions = np.minimum(positions, len(self.areas) - 1)
+        known = self.areas[positions] == areas
+        return np.where(known, self.factors[positions, buckets], 1.0)
+
+_profiles = None
+_profiles_mtime = None
+_profiles_checked_at = 0
+
+def get_speed_profiles():
+    """The current profiles for this worker, reloaded when the file is rebuilt"""
+    global _profiles, _profiles_mtime, _profiles_checked_at
+    
+    now = time.monotonic()
+    if now - _profiles_checked_at < RELOAD_CHECK_SECONDS:
+        return _profiles
+    _profiles_checked_at = now
+    
+    try:
+        mtime = os.path.getmtime(SPEED_PROFILE_PATH)
+    except OSError:
+        _profiles, _profiles_mtime = None, None
+        return None
+    
+    if mtime != _profiles_mtime:
+        try:
+            _profiles = SpeedProfiles.load(SPEED_PROFILE_PATH)
+            _profiles_mtime = mtime
+        except Exception as e:
+            logging.error(f"Error loading speed profiles: {str(e)}")
+    return _profiles
+
+def predict_route_duration(route, free_flow_seconds, depart_at=None):
+    """
+    Estimate travel time for a route when leaving at depart_at
+    
+    The free-flow duration is spread over the route's segments by length.
+    Each segment is then scaled by the congestion factor for its area and
+    the time slot in which it is reached, so later segments use later slots.
+    
+    Returns:
+        dict: Predicted duration like get_optimal_route's, plus the overall
+            congestion factor and whether profile data was used
+    """
+    depart_at = depart_at or datetime.now(timezone.utc)
+    predicted = free_flow_seconds
+    profiles = get_speed_profiles()
+    
+    coordinates = route.get('geometry', {}).get('coordinates') or []
+    if profiles is not None and len(coordinates) >= 2 and free_flow_seconds > 0:
+        points = np.asarray(coordinates, dtype=np.float64)[:, :2]
+        lengths = _segment_lengths(points)
+        if lengths.sum() > 0:
+            midpoints = (points[:-1] + points[1:]) / 2
+            segment_areas = _area_ids(midpoints[:, 1], midpoints[:, 0])
+            free_flow = free_flow_seconds * lengths / lengths.sum()
+            
+            start = depart_at.timestamp()
+            offsets = np.concatenate([[0], np.cumsum(free_flow)[:-1]])
+            
+            # Refine once: slots from free-flow arrival times, then from the predicted ones
+            for _ in range(2):
+                buckets = _week_buckets(start + offsets)
+                adjusted = free_flow * profiles.lookup(segment_areas, buckets)
+                offsets = np.concatenate([[0], np.cumsum(adjusted)[:-1]])
+            predicted = float(adjusted.sum())
+    
+    hours = int(predicted // 3600)
+    minutes = int((predicted % 3600) // 60)
+    seconds = int(predicted % 60)
+    return {
+        'hours': hours,
+        'minutes': minutes,
+        'seconds': seconds,
+        'total_seconds': predicted,
+        'congestion_factor': predicted / free_flow_seconds if free_flow_seconds else 1.0,
+        'depart_at': depart_at.isoformat(),
+        'profiled': profiles is not None
+    }
+
+def _week_buckets(timestamps):
+    """Slot of the week (Monday 00:00 UTC is 0) for Unix timestamps"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    # The Unix epoch fell on a Thursday, three days after Monday
+    minutes = (timestamps // 60 + 3 * 24 * 60) % (7 * 24 * 60)
+    return minutes // BUCKET_MINUTES
+
+def _area_ids(latitudes, longitudes):
+    """Vectorised traffic_history.area_id"""
+    rows = np.floor(latitudes / AREA_DEGREES).astype(np.int64) + 1800
+    cols = np.floor(longitudes / AREA_DEGREES).astype(np.int64) + 3600
+    return (rows * 7201 + cols).astype('<i4')
+
+def _segment_lengths(points):
+    """Approximate length in meters of each segment of [lng, lat] points"""
+    lng = np.radians(points[:, 0])
+    lat = np.radians(points[:, 1])
+    x = np.diff(lng) * np.cos((lat[:-1] + lat[1:]) / 2)
+    y = np.diff(lat)
+    return 6371e3 * np.hypot(x, y)
+
+@app.cli.command('build-speed-profiles')
+@click.option('--days', default=SPEED_PROFILE_DAYS, show_default=True,
+              help='Days of traffic history to include.')
+def build_speed_profiles_command(days):
+    """Build time-of-day congestion profiles from stored traffic snapshots."""
+    end_date = datetime.now(timezone.utc).date()
+    areas = build_speed_profiles(end_date - timedelta(days=days - 1), end_date)
+    click.echo(f"Built speed profiles for {areas} areas")
@@ -0,0 +1,420 @@
+import os
+import json
+import math
+import time
+import queue
+import socket
+import logging
+import ipaddress
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import requests
+from sqlalchemy import select, delete
+from app import app, db
+from models import StationSubscription, StationChange
+from db_routing import primary_reads
+from sos_stream import EventBroker
+
+# Subscription settings from environment
+MAX_SUBSCRIPTION_RADIUS = int(os.environ.get("MAX_SUBSCRIPTION_RADIUS", 50000))
+MAX_SUBSCRIPTIONS_PER_USER = int(os.environ.get("MAX_SUBSCRIPTIONS_PER_USER", 20))
+SUBSCRIPTION_SYNC_SECONDS = int(os.environ.get("SUBSCRIPTION_SYNC_SECONDS", 10))
+CHANGE_POLL_SECONDS = float(os.environ.get("CHANGE_POLL_SECONDS", 2))
+CHANGE_RETENTION_HOURS = int(os.environ.get("CHANGE_RETENTION_HOURS", 24))
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", 5))
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 4))
+STREAM_KEEPALIVE_SECONDS = 15
+
+STATION_STATUSES = ('operational', 'closed', 'maintenance')
+
+# Subscriptions are indexed by every grid cell their circle overlaps
+GRID_DEGREES = 0.1
+
+# Rows are stamped before they commit, so each sync looks back this far
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Changes replayed to a reconnecting stream at most
+MAX_REPLAY = 1000
+
+class SubscriptionIndex:
+    """
+    Grid index from map cells to the subscriptions whose area overlaps them
+    
+    A change is matched by looking up the one cell containing the station
+    and checking the subscriptions listed there, so the cost depends on how
+    many subscriptions cover that spot, not on how many exist in total.
+    """
+    
+    def __init__(self):
+        self._subscriptions = {}
+        self._cells = defaultdict(set)
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.synced_at = None
+        self.checked_at = 0
+    
+    def upsert(self, subscription):
+        """Add or refresh a subscription; inactive ones are removed"""
+        with self._lock:
+            self.remove(subscription.id)
+            if not subscription.active:
+                return
+            
+            cells = _covered_cells(subscription.latitude, subscription.longitude, subscription.radius)
+            self._subscriptions[subscription.id] = {
+                'id': subscription.id,
+                'latitude': subscription.latitude,
+                'longitude': subscription.longitude,
+                'radius': subscription.radius,
+                'statuses': frozenset(subscription.statuses.split(',')) if subscription.statuses else None,
+                'price_changes': subscription.price_changes,
+                'webhook_url': subscription.webhook_url,
+                'cells': cells
+            }
+            for cell in cells:
+                self._cells[cell].add(subscription.id)
+    
+    def remove(self, subscription_id):
+        with self._lock:
+            entry = self._subscriptions.pop(subscription_id, None)
+            if entry is None:
+                return
+            for cell in entry['cells']:
+                members = self._cells[cell]
+                members.discard(subscription_id)
+                if not members:
+                    del self._cells[cell]
+    
+    def get(self, subscription_id):
+        return self._subscriptions.get(subscription_id)
+    
+    def match(self, change):
+        """Subscriptions notified of a change, given as StationChange.to_dict()"""
+        cell = _grid_cell(change['latitude'], change['longitude'])
+        with self._lock:
+            candidates = [self._subscriptions[subscription_id] for subscription_id in self._cells.get(cell, ())]
+        return [entry for entry in candidates if notifies(entry, change)]
+
+def notifies(entry, change):
+    """Whether a change passes a subscription's filters and falls inside its area"""
+    status_changed = change['new_status'] != change['old_status']
+    price_changed = change['new_price'] != change['old_price']
+    
+    wanted = (
+        (status_changed and (entry['statuses'] is None or change['new_status'] in entry['statuses']))
+        or (price_changed and entry['price_changes'])
+    )
+    if not wanted:
+        return False
+    
+    distance = _distance(entry['latitude'], entry['longitude'], change['latitude'], change['longitude'])
+    return distance <= entry['radius']
+
+def _grid_cell(latitude, longitude):
+    return int(math.floor(latitude / GRID_DEGREES)), int(math.floor(longitude / GRID_DEGREES))
+
+def _covered_cells(latitude, longitude, radius):
+    """Grid cells overlapping the bounding box of a circle"""
+    lat_span = radius / 111195
+    lng_span = radius / (111195 * max(math.cos(math.radians(min(abs(latitude) + lat_span, 89.0))), 0.01))
+    south, west = _grid_cell(latitude - lat_span, longitude - lng_span)
+    north, east = _grid_cell(latitude + lat_span, longitude + lng_span)
+    return [(row, col) for row in range(south, north + 1) for col in range(west, east + 1)]
+
+def _distance(lat1, lng1, lat2, lng2):
+    """Haversine distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 6371e3 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+# Index shared by the requests of this worker process
+subscription_index = SubscriptionIndex()
+
+def sync_subscription_index():
+    """
+    Load the index on first use, then pick up subscriptions changed by other workers
+    
+    Subscriptions created or cancelled in this worker are applied
+    immediately; this catches everyone else's at most every
+    SUBSCRIPTION_SYNC_SECONDS.
+    """
+    now = time.monotonic()
+    if subscription_index.loaded and now - subscription_index.checked_at < SUBSCRIPTION_SYNC_SECONDS:
+        return
+    
+    with subscription_index._lock:
+        if subscription_index.loaded and now - subscription_index.checked_at < SUBSCRIPTION_SYNC_SECONDS:
+            return
+        
+        query = select(StationSubscription)
+        if subscription_index.synced_at is None:
+            query = query.where(StationSubscription.active.is_(True))
+        else:
+            query = query.where(StationSubscription.updated_at >= subscription_index.synced_at - SYNC_OVERLAP)
+        
+        started = datetime.utcnow()
+        with primary_reads():
+            for subscription in db.session.scalars(query).yield_per(1000):
+                subscription_index.upsert(subscription)
+        
+        subscription_index.synced_at = started
+        subscription_index.checked_at = now
+        subscription_index.loaded = True
+
+def validate_subscription(latitude, longitude, radius, statuses, webhook_url):
+    """Error message for invalid subscription settings, or None"""
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        return 'Invalid coordinates'
+    if not 0 < radius <= MAX_SUBSCRIPTION_RADIUS:
+        return f'Radius must be between 1 and {MAX_SUBSCRIPTION_RADIUS} meters'
+    unknown = [status for status in statuses if status not in STATION_STATUSES]
+    if unknown:
+        return f"Unknown status: {', '.join(unknown)}"
+    if webhook_url:
+        return webhook_url_error(webhook_url)
+    return None
+
+def webhook_url_error(url):
+    """
+    Error message if a webhook URL must not be called, or None
+    
+    The host is resolved and every address it maps to must be public, so a
+    subscription cannot make the server post to itself or its private
+    network. Checked when subscribing and again before each delivery, since
+    DNS can change in between.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return 'Invalid webhook URL'
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return 'Webhook URL must be an http or https URL'
+    
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        return 'Webhook host could not be resolved'
+    
+    for address in addresses:
+        address = ipaddress.ip_address(address.split('%')[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            return 'Webhook URL must point to a public address'
+    return None
+
+def record_station_change(station, old_status, old_price):
+    """Add a StationChange for an edited station to the session, or None if nothing watched changed"""
+    if station.status == old_status and station.price == old_price:
+        return None
+    
+    change = StationChange(
+        station_id=station.id,
+        station_name=station.name,
+        latitude=station.latitude,
+        longitude=station.longitude,
+        old_status=old_status,
+        new_status=station.status,
+        old_price=old_price,
+        new_price=station.price
+    )
+    db.session.add(change)
+    return change
+
+class WebhookSender:
+    """Posts change notifications from a small thread pool so update_station never waits on them"""
+    
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def submit(self, url, subscription_id, event):
+        with self._lock:
+            # Thread pools do not survive fork, so each worker starts its own
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix='station-webhook')
+                self._pid = os.getpid()
+        self._executor.submit(_post_webhook, url, subscription_id, event)
+
+def _post_webhook(url, subscription_id, event):
+    try:
+        error = webhook_url_error(url)
+        if error:
+            raise ValueError(error)
+        
+        # A redirect could lead anywhere, including addresses refused above
+        response = requests.post(
+            url,
+            json={'subscription_id': subscription_id, 'change': event},
+            timeout=WEBHOOK_TIMEOUT,
+            allow_redirects=False
+        )
+        if response.is_redirect:
+            raise ValueError(f"Redirect to {response.headers.get('Location')} not followed")
+        response.raise_for_status()
+    except Exception as e:
+        logging.error(f"Error delivering station change {event['id']} to webhook of subscription {subscription_id}: {str(e)}")
+
+webhook_sender = WebhookSender()
+_pruned_at = 0
+
+def notify_station_change(change):
+    """Send a committed change to the webhooks of every subscription it affects"""
+    global _pruned_at
+    
+    try:
+        sync_subscription_index()
+        event = change.to_dict()
+        for entry in subscription_index.match(event):
+            if entry['webhook_url']:
+                webhook_sender.submit(entry['webhook_url'], entry['id'], event)
+        
+        # Streams only need recent changes, so old ones are pruned hourly
+        if time.monotonic() - _pruned_at > 3600:
+            _pruned_at = time.monotonic()
+            cutoff = datetime.utcnow() - timedelta(hours=CHANGE_RETENTION_HOURS)
+            db.session.execute(delete(StationChange).where(StationChange.created_at < cutoff))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error notifying subscribers of station change: {str(e)}")
+
+class ChangeFeed:
+    """
+    Delivers changes to the streams connected to this worker
+    
+    One background thread per worker polls the change table, whichever
+    worker made the change, and publishes each one to the streams of the
+    subscriptions it matches. Ids are assigned before commit, so a change
+    with a lower id can become visible after a higher one; each poll
+    therefore re-reads the last SYNC_OVERLAP of changes by created_at and
+    skips the ones already published.
+    """
+    
+    def __init__(self):
+        self.polled_at = None
+        self.published = {}
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            
+            # Changes already visible are history; only later commits are published
+            self.polled_at = datetime.utcnow()
+            with app.app_context():
+                self.published = dict(db.session.execute(
+                    select(StationChange.id, StationChange.created_at)
+                    .where(StationChange.created_at >= self.polled_at - SYNC_OVERLAP)
+                ).all())
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='station-change-feed', daemon=True)
+            self._thread.start()
+    
+    def poll(self):
+        started = datetime.utcnow()
+        window_start = self.polled_at - SYNC_OVERLAP
+        with app.app_context():
+            changes = db.session.scalars(
+                select(StationChange)
+                .where(StationChange.created_at >= window_start)
+                .order_by(StationChange.created_at, StationChange.id)
+            ).all()
+            changes = [change for change in changes if change.id not in self.published]
+            
+            if changes:
+                sync_subscription_index()
+            for change in changes:
+                event = change.to_dict()
+                for entry in subscription_index.match(event):
+                    change_broker.publish(entry['id'], event)
+                self.published[change.id] = change.created_at
+        
+        # Only ids still inside the next window need remembering
+        self.polled_at = started
+        cutoff = started - SYNC_OVERLAP
+        self.published = {
+            change_id: created_at for change_id, created_at in self.published.items()
+            if created_at >= cutoff
+        }
+    
+    def _run(self):
+        while True:
+            time.sleep(CHANGE_POLL_SECONDS)
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Error polling station changes: {str(e)}")
+
+change_broker = EventBroker()
+change_feed = ChangeFeed()
+
+def change_events(subscription_id, last_event_id=None):
+    """
+    Server-sent events for one subscription
+    
+    A client reconnecting with Last-Event-ID first receives the matching
+    changes it missed, as long as they are within CHANGE_RETENTION_HOURS.
+    Changes committed around the one it last saw are replayed too, so the
+    client may receive a few it already has again, with the same id.
+    """
+    change_feed.ensure_started()
+    subscriber = change_broker.subscribe(subscription_id)
+    
+    try:
+        # Servers send headers with the first chunk, so open the stream at once
+        yield ": connected\n\n"
+        
+        # Subscribed first, so nothing published during the replay is lost;
+        # the feed may publish a replayed change again, so those are skipped
+        missed = _missed_changes(subscription_id, last_event_id) if last_event_id else []
+        replayed = {event['id'] for event in missed}
+        for event in missed:
+            yield _sse(event)
+        
+        while True:
+            try:
+                event = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if event['id'] not in replayed:
+                yield _sse(event)
+    finally:
+        change_broker.unsubscribe(subscription_id, subscriber)
+
+def _missed_changes(subscription_id, last_event_id):
+    with app.app_context():
+        sync_subscription_index()
+        entry = subscription_index.get(subscription_id)
+        if entry is None:
+            return []
+        
+        # Ids do not commit in order, so a lower id may have landed after the
+        # client's last event; look back SYNC_OVERLAP from when that one was made
+        query = select(StationChange).where(StationChange.id != last_event_id)
+        last_seen_at = db.session.scalar(select(StationChange.created_at).where(StationChange.id == last_event_id))
+        if last_seen_at is None:
+            query = query.where(StationChange.id > last_event_id)
+        else:
+            query = query.where(StationChange.created_at >= last_seen_at - SYNC_OVERLAP)
+        
+        changes = db.session.scalars(
+            query.order_by(StationChange.created_at, StationChange.id).limit(MAX_REPLAY)
+        ).all()
+        events = [change.to_dict() for change in changes]
+    return [event for event in events if notifies(entry, event)]
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: station\ndata: {json.dumps(event)}\n\n"
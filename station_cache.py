@@ -0,0 +1,84 @@
+import json
+
+# Use orjson for encoding when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(value):
+    """Encode a value as compact JSON text, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+class StationPayload:
+    """Pre-serialized pieces of one station, reused until the station changes"""
+    __slots__ = ('version', 'fields', 'json_prefix', 'popup_prefix')
+    
+    def __init__(self, station, version):
+        self.version = version
+        self.fields = {
+            'id': station.id,
+            'name': station.name,
+            'latitude': station.latitude,
+            'longitude': station.longitude,
+            'address': station.address,
+            'status': station.status,
+            'price': station.price,
+            'operating_hours': station.operating_hours
+        }
+        
+        # JSON object with the closing brace left off so the per-request
+        # distance can be appended without re-encoding the rest
+        self.json_prefix = dumps(self.fields)[:-1]
+        
+        self.popup_prefix = _popup_prefix(self.fields)
+
+# Payloads by station id, per worker process
+_payloads = {}
+
+def get_station_payload(station):
+    """
+    Return the cached payload for a station, rebuilding it if the station changed
+    
+    The station's updated_at (or created_at) is the cache version, so an
+    update made through any worker is picked up on the next lookup.
+    """
+    version = station.updated_at or station.created_at
+    payload = _payloads.get(station.id)
+    if payload is None or payload.version != version:
+        payload = StationPayload(station, version)
+        _payloads[station.id] = payload
+    return payload
+
+def invalidate_station(station_id):
+    """Drop the cached payload for a station"""
+    _payloads.pop(station_id, None)
+
+def station_popup_html(station):
+    """Popup markup for a nearby-station dict, built from the cached prefix"""
+    payload = _payloads.get(station['id'])
+    prefix = payload.popup_prefix if payload is not None else _popup_prefix(station)
+    return prefix + f"{station['distance']:.2f} meters\n        "
+
+def _popup_prefix(fields):
+    """Popup markup for a station up to the distance value"""
+    return f"""
+        <strong>{fields['name']}</strong><br>
+        Status: {fields['status']}<br>
+        Price: ₹{fields['price']:.2f}/kg<br>
+        Address: {fields['address']}<br>
+        Hours: {fields['operating_hours']}<br>
+        Distance: """
+
+def encode_stations(stations):
+    """JSON array text for nearby-station dicts, built from cached fragments"""
+    parts = []
+    for station in stations:
+        payload = _payloads.get(station['id'])
+        if payload is None:
+            parts.append(dumps(station))
+        else:
+            parts.append(f"{payload.json_prefix},\"distance\":{dumps(station['distance'])}}}")
+    return '[' + ','.join(parts) + ']'
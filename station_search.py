@@ -0,0 +1,391 @@
+import os
+import re
+import math
+import time
+import heapq
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
+from operator import itemgetter
+from datetime import datetime
+from db_routing import primary_reads
+
+# Search settings from environment
+SEARCH_INDEX_REFRESH_SECONDS = int(os.environ.get("SEARCH_INDEX_REFRESH_SECONDS", 30))
+
+# Relative weight of a match in each field
+FIELD_WEIGHTS = {'name': 1.0, 'address': 0.6}
+
+# Relative weight of each kind of token match
+EXACT_MATCH, PREFIX_MATCH, FUZZY_MATCH = 1.0, 0.8, 0.5
+
+# Most vocabulary tokens a single prefix or typo may expand to
+MAX_EXPANSIONS = 200
+
+# Distance in km at which the geographic bias halves a station's score
+GEO_BIAS_KM = 10
+
+# Grid used to rank large candidate sets by distance without scoring them all
+GRID_DEGREES = 0.1
+GEO_SCAN_LIMIT = 2000
+MAX_GRID_RINGS = 50
+
+# Station fields returned by search
+RESULT_FIELDS = ('id', 'name', 'address', 'latitude', 'longitude', 'status')
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Lower-case, accent-free alphanumeric tokens of text"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def within_edit_distance(a, b, limit):
+    """True if the Levenshtein distance between a and b is at most limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+class StationSearchIndex:
+    """
+    In-memory token index over station names and addresses
+    
+    Postings map each token to the stations containing it, with the weight
+    of the best field it appears in. A sorted vocabulary answers prefix
+    lookups by bisection, and a trigram index over the vocabulary finds
+    candidates for typo-tolerant matches without scanning every token.
+    Stations are also bucketed on a coarse lat/lng grid for biased ranking.
+    """
+    
+    def __init__(self):
+        self._stations = {}
+        self._postings = defaultdict(dict)
+        self._vocabulary = []
+        self._trigrams = defaultdict(set)
+        self._cells = defaultdict(set)
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.synced_at = None
+        self.checked_at = 0
+    
+    def __len__(self):
+        return len(self._stations)
+    
+    def upsert(self, station):
+        """Add a station to the index, replacing any previous version of it"""
+        with self._lock:
+            self._remove(station.id)
+            
+            token_weights = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(getattr(station, field)):
+                    token_weights[token] = max(token_weights.get(token, 0), weight)
+            
+            for token, weight in token_weights.items():
+                postings = self._postings[token]
+                if not postings:
+                    self._add_token(token)
+                postings[station.id] = weight
+            
+            cell = _grid_cell(station.latitude, station.longitude)
+            self._cells[cell].add(station.id)
+            
+            self._stations[station.id] = {
+                'id': station.id,
+                'name': station.name,
+                'address': station.address,
+                'latitude': station.latitude,
+                'longitude': station.longitude,
+                'status': station.status,
+                'tokens': tuple(token_weights),
+                'cell': cell
+            }
+    
+    def remove(self, station_id):
+        """Drop a station from the index"""
+        with self._lock:
+            self._remove(station_id)
+    
+    def search(self, query, latitude=None, longitude=None, limit=10):
+        """
+        Find stations matching every word of query
+        
+        The last word is matched as a prefix, and words of four or more
+        letters also match tokens within one edit (two for long words).
+        When latitude and longitude are given, nearer stations rank higher.
+        
+        Returns:
+            list: Station dicts with a relevance score, best first
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        
+        with self._lock:
+            expansions = [
+                self._expand_word(word, is_last=(position == len(words) - 1))
+                for position, word in enumerate(words)
+            ]
+            if not all(expansions):
+                return []
+            
+            # Start from the rarest word so the candidate set stays small
+            expansions.sort(key=_posting_count)
+            scores = _word_scores(expansions[0])
+            for expansion in expansions[1:]:
+                scores = _add_word_scores(scores, expansion)
+                if not scores:
+                    return []
+            
+            if latitude is not None and longitude is not None:
+                best = self._rank_near(scores, latitude, longitude, limit)
+            else:
+                best = [(score, station_id, None) for station_id, score in
+                        heapq.nlargest(limit, scores.items(), key=itemgetter(1))]
+            
+            results = []
+            for score, station_id, distance in best:
+                station = self._stations[station_id]
+                result = {key: station[key] for key in RESULT_FIELDS}
+                result['score'] = round(score, 4)
+                if distance is not None:
+                    result['distance'] = distance
+                results.append(result)
+            return results
+    
+    def _expand_word(self, word, is_last):
+        """List of (postings, match quality) for the tokens word may stand for"""
+        expansions = {word: EXACT_MATCH} if word in self._postings else {}
+        
+        if is_last:
+            for token in self._tokens_with_prefix(word):
+                expansions.setdefault(token, PREFIX_MATCH)
+        
+        if not expansions and len(word) >= 4:
+            for token in self._similar_tokens(word, 2 if len(word) >= 8 else 1):
+                expansions.setdefault(token, FUZZY_MATCH)
+        
+        return [(self._postings[token], quality) for token, quality in expansions.items()]
+    
+    def _rank_near(self, scores, latitude, longitude, limit):
+        """
+        Top stations by score discounted for distance from a point
+        
+        Small candidate sets are ranked directly. Large ones are visited
+        grid ring by grid ring outwards, stopping once no station further
+        out could beat the current top results.
+        """
+        def discounted(station_id):
+            station = self._stations[station_id]
+            distance = _approximate_distance(latitude, longitude, station['latitude'], station['longitude'])
+            return scores[station_id] / (1 + distance / (GEO_BIAS_KM * 1000)), station_id, distance
+        
+        if len(scores) <= GEO_SCAN_LIMIT:
+            return heapq.nlargest(limit, map(discounted, scores), key=itemgetter(0))
+        
+        max_score = max(scores.values())
+        origin_row, origin_col = _grid_cell(latitude, longitude)
+        top = []
+        seen = set()
+        
+        for ring in range(MAX_GRID_RINGS + 1):
+            for cell in _ring_cells(origin_row, origin_col, ring):
+                for station_id in self._cells.get(cell, ()):
+                    if station_id in scores:
+                        seen.add(station_id)
+                        item = discounted(station_id)
+                        if len(top) < limit:
+                            heapq.heappush(top, item)
+                        elif item[0] > top[0][0]:
+                            heapq.heapreplace(top, item)
+            
+            if len(seen) == len(scores):
+                break
+            
+            # Anything beyond this ring is at least this far away
+            nearest_outside = ring * GRID_DEGREES * _meters_per_degree(latitude, ring)
+            if len(top) == limit and max_score / (1 + nearest_outside / (GEO_BIAS_KM * 1000)) <= top[0][0]:
+                break
+        else:
+            # Candidates too spread out for the grid walk: rank the rest directly
+            rest = (station_id for station_id in scores if station_id not in seen)
+            top = heapq.nlargest(limit, list(top) + [discounted(i) for i in rest], key=itemgetter(0))
+        
+        return sorted(top, key=itemgetter(0), reverse=True)
+    
+    def _tokens_with_prefix(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        tokens = []
+        for token in self._vocabulary[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+    
+    def _similar_tokens(self, word, limit):
+        """Vocabulary tokens within limit edits of word"""
+        word_trigrams = trigrams(word)
+        
+        # Each edit changes at most three trigrams
+        needed = max(1, len(word_trigrams) - 3 * limit)
+        counts = defaultdict(int)
+        for trigram in word_trigrams:
+            for token in self._trigrams.get(trigram, ()):
+                counts[token] += 1
+        
+        similar = [
+            token for token, count in counts.items()
+            if count >= needed and within_edit_distance(word, token, limit)
+        ]
+        return similar[:MAX_EXPANSIONS]
+    
+    def _add_token(self, token):
+        bisect.insort(self._vocabulary, token)
+        for trigram in trigrams(token):
+            self._trigrams[trigram].add(token)
+    
+    def _remove(self, station_id):
+        station = self._stations.pop(station_id, None)
+        if station is None:
+            return
+        self._cells[station['cell']].discard(station_id)
+        for token in station['tokens']:
+            postings = self._postings[token]
+            postings.pop(station_id, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._vocabulary, token)
+                if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                    del self._vocabulary[index]
+                for trigram in trigrams(token):
+                    self._trigrams[trigram].discard(token)
+
+def _posting_count(expansion):
+    return sum(len(postings) for postings, quality in expansion)
+
+def _word_scores(expansion):
+    """Map station id to the best weight with which one query word matches it"""
+    if len(expansion) == 1:
+        postings, quality = expansion[0]
+        return {station_id: quality * weight for station_id, weight in postings.items()}
+    
+    scores = {}
+    for postings, quality in expansion:
+        for station_id, weight in postings.items():
+            value = quality * weight
+            if value > scores.get(station_id, 0):
+                scores[station_id] = value
+    return scores
+
+def _add_word_scores(scores, expansion):
+    """Keep the stations in scores that also match expansion, adding its weight"""
+    if len(expansion) == 1:
+        postings, quality = expansion[0]
+        return {station_id: score + quality * postings[station_id]
+                for station_id, score in scores.items() if station_id in postings}
+    
+    if len(scores) * len(expansion) < _posting_count(expansion):
+        # Few candidates left: probe the postings instead of walking them
+        combined = {}
+        for station_id, score in scores.items():
+            best = 0
+            for postings, quality in expansion:
+                weight = postings.get(station_id)
+                if weight is not None and quality * weight > best:
+                    best = quality * weight
+            if best:
+                combined[station_id] = score + best
+        return combined
+    
+    word_scores = _word_scores(expansion)
+    return {station_id: score + word_scores[station_id]
+            for station_id, score in scores.items() if station_id in word_scores}
+
+def _grid_cell(latitude, longitude):
+    return int(math.floor(latitude / GRID_DEGREES)), int(math.floor(longitude / GRID_DEGREES))
+
+def _ring_cells(row, col, ring):
+    """Grid cells at Chebyshev distance ring from (row, col)"""
+    if ring == 0:
+        yield row, col
+        return
+    for offset in range(-ring, ring + 1):
+        yield row - ring, col + offset
+        yield row + ring, col + offset
+    for offset in range(-ring + 1, ring):
+        yield row + offset, col - ring
+        yield row + offset, col + ring
+
+def _meters_per_degree(latitude, ring):
+    """Lower bound on meters per degree in any direction within ring cells of latitude"""
+    furthest = min(89.0, abs(latitude) + (ring + 1) * GRID_DEGREES)
+    return 111195 * math.cos(math.radians(furthest))
+
+def _approximate_distance(lat1, lng1, lat2, lng2):
+    """Equirectangular distance in meters, accurate enough for ranking"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371e3 * math.hypot(x, y)
+
+# Index shared by the requests of this worker process
+station_index = StationSearchIndex()
+
+def sync_station_index():
+    """
+    Load the index on first use, then pick up stations changed by other workers
+    
+    Changes made in this worker are applied immediately by add_station and
+    update_station; this catches everyone else's at most every
+    SEARCH_INDEX_REFRESH_SECONDS.
+    """
+    from models import CNGStation
+    from app import db
+    
+    now = time.monotonic()
+    if station_index.loaded and now - station_index.checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+        return
+    
+    with station_index._lock:
+        if station_index.loaded and now - station_index.checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return
+        
+        query = CNGStation.query
+        if station_index.synced_at is not None:
+            since = station_index.synced_at
+            query = query.filter(db.or_(CNGStation.created_at >= since, CNGStation.updated_at >= since))
+        
+        # Note the time first so changes made during the load are seen next time.
+        # Read from the primary: a lagging replica would move the watermark
+        # past rows it has not received yet.
+        started = datetime.utcnow()
+        count = 0
+        with primary_reads():
+            for station in query.yield_per(1000):
+                station_index.upsert(station)
+                count += 1
+        
+        station_index.synced_at = started
+        station_index.checked_at = now
+        if not station_index.loaded:
+            logging.info(f"Built station search index with {count} stations")
+        station_index.loaded = True
@@ -0,0 +1,44 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("TRAFFIC_HISTORY_DIR", os.path.join(os.path.dirname(__file__), ".traffic_history"))
+
+from app import app, db
+from models import User, SOSRequest, SOSRequestArchive
+from sos_archive import archive_sos_requests
+
+def make_sos_request(user, status='resolved', resolved_hours_ago=48):
+    sos_request = SOSRequest(
+        user_id=user.id,
+        latitude=28.61,
+        longitude=77.21,
+        message='Help',
+        status=status,
+        resolved_at=datetime.utcnow() - timedelta(hours=resolved_hours_ago)
+    )
+    db.session.add(sos_request)
+    db.session.commit()
+    return sos_request
+
+def test_archived_ids_are_not_reused():
+    with app.app_context():
+        user = User(username='archive-test', email='archive-test@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        
+        first = make_sos_request(user)
+        first_id = first.id
+        assert archive_sos_requests() == 1
+        
+        # The newest request was archived; the next one must not take its id
+        second = make_sos_request(user)
+        assert second.id != first_id
+        assert archive_sos_requests() == 1
+        
+        archived_ids = {row.id for row in db.session.scalars(db.select(SOSRequestArchive))}
+        assert archived_ids == {first_id, second.id}
+        assert db.session.scalars(db.select(SOSRequest)).all() == []
@@ -0,0 +1,209 @@
+import os
+import math
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from station_cache import dumps
+from traffic_history import query_recent_traffic, summarize_locations
+
+# Tile settings from environment
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", 2048))
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR")  # Optional on-disk cache
+TRAFFIC_TILE_MINUTES = int(os.environ.get("TRAFFIC_TILE_MINUTES", 15))
+TRAFFIC_TILE_TTL = 60
+
+# Zoom levels served; below STATION_CLUSTER_ZOOM stations are sent as clusters
+MIN_ZOOM, MAX_ZOOM = 3, 19
+STATION_CLUSTER_ZOOM = 10
+CLUSTER_GRID = 16
+
+TILE_LAYERS = ('stations', 'traffic')
+
+class TileCache:
+    """
+    Bounded LRU of rendered tiles, optionally backed by files on disk
+    
+    Keys include the layer's data version, so a tile rendered from stale
+    data is simply never asked for again and ages out.
+    """
+    
+    def __init__(self, max_tiles=TILE_CACHE_SIZE, directory=TILE_CACHE_DIR):
+        self.max_tiles = max_tiles
+        self.directory = directory
+        self._tiles = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+        
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as tile_file:
+                    tile = tile_file.read()
+                self._remember(key, tile)
+                return tile
+            except OSError:
+                pass
+        return None
+    
+    def set(self, key, tile):
+        self._remember(key, tile)
+        if self.directory:
+            path = self._path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary_path = f"{path}.{os.getpid()}.tmp"
+                with open(temporary_path, 'wb') as tile_file:
+                    tile_file.write(tile)
+                os.replace(temporary_path, path)
+            except OSError as e:
+                logging.error(f"Error writing tile cache: {str(e)}")
+    
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+    
+    def drop_other_versions(self, layer, version):
+        """Delete on-disk tiles of a layer rendered from any other version"""
+        if self._versions.get(layer) == version:
+            return
+        self._versions[layer] = version
+        if not self.directory:
+            return
+        
+        layer_directory = os.path.join(self.directory, layer)
+        try:
+            stale = [name for name in os.listdir(layer_directory) if name != version]
+        except OSError:
+            return
+        for name in stale:
+            shutil.rmtree(os.path.join(layer_directory, name), ignore_errors=True)
+    
+    def _remember(self, key, tile):
+        with self._lock:
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+    
+    def _path(self, key):
+        layer, version, z, x, y = key
+        return os.path.join(self.directory, layer, version, str(z), str(x), f"{y}.json")
+
+tile_cache = TileCache()
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a Web Mercator tile"""
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def valid_tile(z, x, y):
+    return MIN_ZOOM <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def stations_version():
+    """Changes whenever a station is added or updated, in any worker"""
+    from models import CNGStation
+    from app import db
+    
+    # Both columns are indexed, so this reads two index ends rather than the table
+    created, updated = db.session.execute(
+        db.select(db.func.max(CNGStation.created_at), db.func.max(CNGStation.updated_at))
+    ).one()
+    stamp = max((value for value in (created, updated) if value is not None), default=None)
+    return f"{stamp:%Y%m%d%H%M%S%f}" if stamp else "empty"
+
+def traffic_version():
+    """Changes every TRAFFIC_TILE_TTL seconds so traffic tiles stay fresh"""
+    return str(int(datetime.now(timezone.utc).timestamp()) // TRAFFIC_TILE_TTL)
+
+def get_tile(layer, z, x, y):
+    """
+    Rendered tile as compact JSON bytes, and the version it was rendered from
+    
+    Returns:
+        tuple: (payload, version)
+    """
+    version = stations_version() if layer == 'stations' else traffic_version()
+    key = (layer, version, z, x, y)
+    tile_cache.drop_other_versions(layer, version)
+    
+    tile = tile_cache.get(key)
+    if tile is None:
+        payload = render_station_tile(z, x, y) if layer == 'stations' else render_traffic_tile(z, x, y)
+        tile = dumps(payload).encode('utf-8')
+        tile_cache.set(key, tile)
+    return tile, version
+
+def render_station_tile(z, x, y):
+    """Stations inside a tile, as rows under a shared field list, or clusters when zoomed out"""
+    from models import CNGStation
+    
+    south, west, north, east = tile_bounds(z, x, y)
+    rows = CNGStation.query.with_entities(
+        CNGStation.id, CNGStation.latitude, CNGStation.longitude,
+        CNGStation.name, CNGStation.status, CNGStation.price
+    ).filter(
+        CNGStation.latitude >= south, CNGStation.latitude < north,
+        CNGStation.longitude >= west, CNGStation.longitude < east
+    ).all()
+    
+    if z < STATION_CLUSTER_ZOOM:
+        return {
+            'layer': 'stations',
+            'z': z, 'x': x, 'y': y,
+            'fields': ['latitude', 'longitude', 'count'],
+            'clusters': _cluster(rows, south, west, north, east)
+        }
+    
+    return {
+        'layer': 'stations',
+        'z': z, 'x': x, 'y': y,
+        'fields': ['id', 'latitude', 'longitude', 'name', 'status', 'price'],
+        'features': [list(row) for row in rows]
+    }
+
+def render_traffic_tile(z, x, y):
+    """Average severity per location from recent traffic snapshots inside a tile"""
+    south, west, north, east = tile_bounds(z, x, y)
+    since = datetime.now(timezone.utc) - timedelta(minutes=TRAFFIC_TILE_MINUTES)
+    locations = summarize_locations(query_recent_traffic(south, west, north, east, since))
+    
+    return {
+        'layer': 'traffic',
+        'z': z, 'x': x, 'y': y,
+        'fields': ['latitude', 'longitude', 'severity', 'samples'],
+        'features': [
+            [location['latitude'], location['longitude'], round(location['severity'], 2), location['samples']]
+            for location in locations
+        ]
+    }
+
+def _cluster(rows, south, west, north, east):
+    """Group stations on a CLUSTER_GRID x CLUSTER_GRID grid over the tile"""
+    cells = {}
+    for row in rows:
+        latitude, longitude = row[1], row[2]
+        cell = (
+            min(CLUSTER_GRID - 1, int((latitude - south) / (north - south) * CLUSTER_GRID)),
+            min(CLUSTER_GRID - 1, int((longitude - west) / (east - west) * CLUSTER_GRID))
+        )
+        total = cells.setdefault(cell, [0.0, 0.0, 0])
+        total[0] += latitude
+        total[1] += longitude
+        total[2] += 1
+    
+    return [
+        [round(lat_sum / count, 5), round(lng_sum / count, 5), count]
+        for lat_sum, lng_sum, count in cells.values()
+    ]
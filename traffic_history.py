@@ -0,0 +1,285 @@
+import os
+import math
+import fcntl
+import logging
+import threading
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+# Where the daily snapshot files live
+TRAFFIC_HISTORY_DIR = os.environ.get("TRAFFIC_HISTORY_DIR", "traffic_history")
+
+# Each location is recorded at most once per time bucket of this many seconds
+TRAFFIC_SNAPSHOT_SECONDS = int(os.environ.get("TRAFFIC_SNAPSHOT_SECONDS", 300))
+
+# Areas are cells of this many degrees, keyed by a single integer
+AREA_DEGREES = 0.05
+
+# Boxes covering more cells than this are filtered by coordinates alone
+MAX_AREA_FILTER = 400
+
+# One fixed-width record per traffic item per snapshot: 17 bytes
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<u4'),  # Seconds since the Unix epoch, UTC
+    ('area', '<i4'),       # area_id() of the item's location
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('severity', 'u1'),    # Item criticality: half the HERE jam factor, 0-5
+])
+
+def area_id(latitude, longitude):
+    """Integer key of the grid cell containing a point"""
+    row = math.floor(latitude / AREA_DEGREES) + 1800
+    col = math.floor(longitude / AREA_DEGREES) + 3600
+    return row * 7201 + col
+
+def areas_in_box(south, west, north, east, limit=None):
+    """Keys of every cell overlapping a bounding box, or None if there are more than limit"""
+    rows = range(math.floor(south / AREA_DEGREES), math.floor(north / AREA_DEGREES) + 1)
+    cols = range(math.floor(west / AREA_DEGREES), math.floor(east / AREA_DEGREES) + 1)
+    
+    # Counted from the ranges, so a huge box never builds its list
+    if limit is not None and len(rows) * len(cols) > limit:
+        return None
+    return [(row + 1800) * 7201 + (col + 3600) for row in rows for col in cols]
+
+def day_path(day):
+    """File holding the snapshots for one UTC day"""
+    return os.path.join(TRAFFIC_HISTORY_DIR, f"traffic-{day:%Y%m%d}.bin")
+
+def traffic_items(traffic_data):
+    """Yield (latitude, longitude, severity) for each located item in a traffic response"""
+    items = traffic_data.get('trafficItems') or []
+    if isinstance(items, dict):
+        items = items.get('trafficItem', [])
+    
+    for item in items:
+        geolocation = item.get('location', {}).get('geolocation')
+        if not geolocation:
+            continue
+        longitude, latitude = geolocation['coordinates'][:2]
+        yield latitude, longitude, int(item.get('criticality', 0))
+
+class SnapshotLog:
+    """
+    Locations already recorded in recent time buckets of a day's file
+    
+    Each process reads only the records appended since its last write, under
+    the same lock as the append, so what it knows covers every worker's
+    writes. Only the current and later buckets are kept.
+    """
+    
+    def __init__(self):
+        self.path = None
+        self.offset = 0
+        self.bucket = None
+        self.keys = set()
+        self.lock = threading.Lock()
+    
+    def catch_up(self, history_file, path, bucket):
+        """Read what other writers appended to path; call with the file locked"""
+        if path != self.path:
+            self.path, self.offset, self.keys = path, 0, set()
+        if bucket != self.bucket:
+            self.bucket = bucket
+            self.keys = {key for key in self.keys if key[0] >= bucket}
+        
+        size = history_file.seek(0, os.SEEK_END)
+        count = (size - self.offset) // RECORD_DTYPE.itemsize
+        if count > 0:
+            records = np.memmap(history_file, dtype=RECORD_DTYPE, mode='r', offset=self.offset, shape=(count,))
+            if self.offset == 0:
+                # First look at this file: skip to just before the bucket, as records are appended in time order
+                first = np.searchsorted(records['timestamp'], (bucket - 1) * TRAFFIC_SNAPSHOT_SECONDS)
+                records = records[first:]
+            self.remember(np.array(records))
+            del records
+        self.offset = size
+    
+    def remember(self, records):
+        buckets = records['timestamp'] // TRAFFIC_SNAPSHOT_SECONDS
+        recent = buckets >= self.bucket
+        self.keys.update(zip(
+            buckets[recent].tolist(), records['area'][recent].tolist(),
+            records['latitude'][recent].tolist(), records['longitude'][recent].tolist()
+        ))
+    
+    def unseen(self, records):
+        """Records whose location is not yet in their bucket, once each"""
+        buckets = records['timestamp'] // TRAFFIC_SNAPSHOT_SECONDS
+        keep = np.zeros(len(records), dtype=bool)
+        added = set()
+        for position, key in enumerate(zip(
+            buckets.tolist(), records['area'].tolist(),
+            records['latitude'].tolist(), records['longitude'].tolist()
+        )):
+            if key not in self.keys and key not in added:
+                added.add(key)
+                keep[position] = True
+        return records[keep]
+
+_snapshot_log = SnapshotLog()
+
+def record_traffic_snapshot(traffic_data, when=None):
+    """
+    Append the located items of a traffic response to today's snapshot file
+    
+    Overlapping queries return the same items, so a location already recorded
+    in the current TRAFFIC_SNAPSHOT_SECONDS bucket, by any worker, is skipped.
+    
+    Returns:
+        int: Number of records written
+    """
+    when = when or datetime.now(timezone.utc)
+    items = list(traffic_items(traffic_data))
+    if not items:
+        return 0
+    
+    latitudes, longitudes, severities = zip(*items)
+    records = np.zeros(len(items), dtype=RECORD_DTYPE)
+    records['timestamp'] = int(when.timestamp())
+    records['area'] = [area_id(lat, lng) for lat, lng in zip(latitudes, longitudes)]
+    records['latitude'] = latitudes
+    records['longitude'] = longitudes
+    records['severity'] = np.clip(severities, 0, 255)
+    
+    path = day_path(when.date())
+    bucket = int(when.timestamp()) // TRAFFIC_SNAPSHOT_SECONDS
+    try:
+        os.makedirs(TRAFFIC_HISTORY_DIR, exist_ok=True)
+        with _snapshot_log.lock, open(path, 'a+b') as history_file:
+            # Workers append to the same file; whole records must not interleave
+            fcntl.flock(history_file, fcntl.LOCK_EX)
+            try:
+                _snapshot_log.catch_up(history_file, path, bucket)
+                records = _snapshot_log.unseen(records)
+                if len(records):
+                    history_file.write(records.tobytes())
+                    history_file.flush()
+                    _snapshot_log.remember(records)
+                    _snapshot_log.offset = history_file.tell()
+            finally:
+                fcntl.flock(history_file, fcntl.LOCK_UN)
+    except OSError as e:
+        logging.error(f"Error recording traffic snapshot: {str(e)}")
+        return 0
+    
+    return len(records)
+
+def query_traffic_history(latitude, longitude, start_date, end_date, weekdays=None,
+                          start_time=None, end_time=None, delta=0.02):
+    """
+    Snapshot records around a point over a date range
+    
+    Args:
+        latitude (float): Centre of the area
+        longitude (float): Centre of the area
+        start_date (date): First UTC day to include
+        end_date (date): Last UTC day to include
+        weekdays (set, optional): Weekday numbers to keep, Monday is 0
+        start_time (time, optional): Earliest UTC time of day to keep
+        end_time (time, optional): Latest UTC time of day to keep (exclusive)
+        delta (float): Half-size in degrees of the box around the point
+    
+    Returns:
+        numpy.ndarray: Matching records with RECORD_DTYPE
+    """
+    bounds = (latitude - delta, longitude - delta, latitude + delta, longitude + delta)
+    start_second = _seconds_of_day(start_time) if start_time else 0
+    end_second = _seconds_of_day(end_time) if end_time else 86400
+    
+    matches = []
+    day = start_date
+    while day <= end_date:
+        if weekdays is None or day.weekday() in weekdays:
+            midnight = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+            matches.append(_scan_day(day, midnight + start_second, midnight + end_second, bounds))
+        day += timedelta(days=1)
+    
+    return _concatenate(matches)
+
+def query_recent_traffic(south, west, north, east, since, until=None):
+    """
+    Snapshot records inside a bounding box between two datetimes
+    
+    Returns:
+        numpy.ndarray: Matching records with RECORD_DTYPE
+    """
+    until = until or datetime.now(timezone.utc)
+    bounds = (south, west, north, east)
+    
+    matches = []
+    day = since.date()
+    while day <= until.date():
+        matches.append(_scan_day(day, int(since.timestamp()), int(until.timestamp()) + 1, bounds))
+        day += timedelta(days=1)
+    
+    return _concatenate(matches)
+
+def _scan_day(day, start_timestamp, end_timestamp, bounds):
+    """Records of one day's file within [start, end) seconds and the south/west/north/east box"""
+    path = day_path(day)
+    if not os.path.exists(path) or os.path.getsize(path) < RECORD_DTYPE.itemsize:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    
+    # Map the file read-only; only whole records are visible
+    count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+    
+    south, west, north, east = bounds
+    timestamps = records['timestamp']
+    mask = (timestamps >= start_timestamp) & (timestamps < end_timestamp)
+    
+    # Narrow by area cell first when the box covers only a few of them
+    areas = areas_in_box(south, west, north, east, limit=MAX_AREA_FILTER)
+    if areas is not None:
+        mask &= np.isin(records['area'], np.array(areas, dtype='<i4'))
+    
+    # Trim down to the exact box
+    candidates = np.array(records[mask])
+    del records
+    inside = (
+        (candidates['latitude'] >= south) & (candidates['latitude'] <= north) &
+        (candidates['longitude'] >= west) & (candidates['longitude'] <= east)
+    )
+    return candidates[inside]
+
+def _concatenate(matches):
+    matches = [records for records in matches if len(records)]
+    if not matches:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.concatenate(matches)
+
+def summarize_locations(records, precision=4):
+    """
+    Average severity per location across snapshots
+    
+    Returns:
+        list: Dicts with latitude, longitude, severity and samples, most severe first
+    """
+    if len(records) == 0:
+        return []
+    
+    scale = 10 ** precision
+    keys = np.stack([
+        np.round(records['latitude'] * scale).astype(np.int64),
+        np.round(records['longitude'] * scale).astype(np.int64)
+    ], axis=1)
+    unique_keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    totals = np.bincount(inverse, weights=records['severity'].astype(np.float64))
+    
+    locations = [
+        {
+            'latitude': float(lat) / scale,
+            'longitude': float(lng) / scale,
+            'severity': float(total / count),
+            'samples': int(count)
+        }
+        for (lat, lng), total, count in zip(unique_keys, totals, counts)
+    ]
+    locations.sort(key=lambda location: location['severity'], reverse=True)
+    return locations
+
+def _seconds_of_day(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
@@ -0,0 +1,152 @@
+import time
+
+# Cost used for stop pairs the routing engine could not connect
+UNREACHABLE_COST = 1e9
+
+def solve_stop_order(durations, return_to_start=False, time_budget=0.5):
+    """
+    Order stops to minimise total travel time
+    
+    Seeds a tour with the nearest-neighbour heuristic starting at stop 0, then
+    improves it with 2-opt and Or-opt moves until no move helps or the time
+    budget runs out. The matrix may be asymmetric.
+    
+    Args:
+        durations (list): Square matrix, durations[i][j] is the travel time from i to j
+        return_to_start (bool): Whether the trip ends back at stop 0
+        time_budget (float): Seconds allowed for the improvement phase
+    
+    Returns:
+        list: Stop indices in visiting order, starting with 0
+    """
+    count = len(durations)
+    if count <= 2:
+        return list(range(count))
+    
+    matrix = [
+        [UNREACHABLE_COST if value is None else value for value in row]
+        for row in durations
+    ]
+    deadline = time.perf_counter() + time_budget
+    
+    path = _nearest_neighbour(matrix)
+    if return_to_start:
+        # Pin stop 0 at the end as well so both ends stay fixed
+        path.append(0)
+    
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = _two_opt_pass(matrix, path, return_to_start, deadline)
+        improved = _or_opt_pass(matrix, path, return_to_start, deadline) or improved
+    
+    if return_to_start:
+        path.pop()
+    return path
+
+def route_cost(durations, order, return_to_start=False):
+    """Total travel time for visiting the stops in the given order"""
+    stops = list(order) + ([order[0]] if return_to_start and order else [])
+    total = 0
+    for current, following in zip(stops, stops[1:]):
+        value = durations[current][following]
+        total += UNREACHABLE_COST if value is None else value
+    return total
+
+def _nearest_neighbour(matrix):
+    """Greedy tour from stop 0 that always visits the closest unvisited stop"""
+    unvisited = set(range(1, len(matrix)))
+    path = [0]
+    while unvisited:
+        row = matrix[path[-1]]
+        closest = min(unvisited, key=row.__getitem__)
+        unvisited.remove(closest)
+        path.append(closest)
+    return path
+
+def _last_movable(path, closed):
+    """Index of the last position that moves may change"""
+    return len(path) - 2 if closed else len(path) - 1
+
+def _two_opt_pass(matrix, path, closed, deadline):
+    """Reverse path segments while that shortens the trip; returns True if it did"""
+    last = _last_movable(path, closed)
+    improved = False
+    
+    # Prefix costs of the path walked forwards and backwards so that the
+    # cost of a reversed segment is an O(1) lookup even when asymmetric
+    forward, backward = _prefix_costs(matrix, path)
+    
+    for i in range(1, last):
+        if time.perf_counter() > deadline:
+            break
+        before = path[i - 1]
+        for j in range(i + 1, last + 1):
+            after = path[j + 1] if j + 1 < len(path) else None
+            
+            old_cost = matrix[before][path[i]] + forward[j] - forward[i]
+            new_cost = matrix[before][path[j]] + backward[j] - backward[i]
+            if after is not None:
+                old_cost += matrix[path[j]][after]
+                new_cost += matrix[path[i]][after]
+            
+            if new_cost < old_cost - 1e-9:
+                path[i:j + 1] = path[i:j + 1][::-1]
+                forward, backward = _prefix_costs(matrix, path)
+                improved = True
+    
+    return improved
+
+def _or_opt_pass(matrix, path, closed, deadline, max_segment=3):
+    """Move short runs of stops to a cheaper position; returns True if any moved"""
+    improved = False
+    
+    for length in range(1, max_segment + 1):
+        i = 1
+        while i + length - 1 <= _last_movable(path, closed):
+            if time.perf_counter() > deadline:
+                return improved
+            
+            start, end = path[i], path[i + length - 1]
+            before = path[i - 1]
+            after = path[i + length] if i + length < len(path) else None
+            
+            # Saving from taking the segment out of its current place
+            removed = matrix[before][start]
+            if after is not None:
+                removed += matrix[end][after] - matrix[before][after]
+            
+            remainder = path[:i] + path[i + length:]
+            best_gain, best_position = 1e-9, None
+            
+            # Try every gap in the remaining path, keeping the start fixed
+            for position in range(len(remainder) if not closed else len(remainder) - 1):
+                left = remainder[position]
+                right = remainder[position + 1] if position + 1 < len(remainder) else None
+                if position == i - 1:
+                    continue
+                
+                added = matrix[left][start]
+                if right is not None:
+                    added += matrix[end][right] - matrix[left][right]
+                
+                gain = removed - added
+                if gain > best_gain:
+                    best_gain, best_position = gain, position
+            
+            if best_position is not None:
+                segment = path[i:i + length]
+                path[:] = remainder[:best_position + 1] + segment + remainder[best_position + 1:]
+                improved = True
+            else:
+                i += 1
+    
+    return improved
+
+def _prefix_costs(matrix, path):
+    """Cumulative cost of walking the path forwards and in reverse"""
+    forward = [0] * len(path)
+    backward = [0] * len(path)
+    for k in range(1, len(path)):
+        forward[k] = forward[k - 1] + matrix[path[k - 1]][path[k]]
+        backward[k] = backward[k - 1] + matrix[path[k]][path[k - 1]]
+    return forward, backward
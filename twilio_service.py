@@ -1,7 +1,9 @@
 import os
 import logging
 import re
+import asyncio
 from twilio.rest import Client
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from datetime import datetime
 
 # Twilio credentials
@@ -9,7 +11,7 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID", "your_twilio_account_s
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN", "your_twilio_auth_token")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER", "your_twilio_phone_number")
 
-def send_sos_message(to_phone_number, user_name, latitude, longitude, custom_message=None):
+def send_sos_message(to_phone_number, user_name, latitude, longitude, custom_message=None, live_url=None):
     """
     Send an SOS message using Twilio
     
@@ -19,6 +21,7 @@ def send_sos_message(to_phone_number, user_name, latitude, longitude, custom_mes
         latitude (float): The user's current latitude
         longitude (float): The user's current longitude
         custom_message (str, optional): Custom message to include
+        live_url (str, optional): Link that always shows the latest location
     
     Returns:
         dict: Status of the message send operation
@@ -26,103 +29,175 @@ def send_sos_message(to_phone_number, user_name, latitude, longitude, custom_mes
     logging.info(f"Preparing to send SOS message to {to_phone_number}")
     
     try:
-        # Validate the phone number first
-        if not to_phone_number:
-            logging.error("Empty phone number provided")
-            return {
-                "success": False,
-                "error": "Empty phone number provided",
-                "timestamp": datetime.now().isoformat()
-            }
-        
-        # Ensure the phone number has a + prefix for the country code
-        # If it doesn't start with +, assume it needs proper E.164 formatting
-        formatted_number = to_phone_number
-        if not to_phone_number.startswith('+'):
-            # Remove any non-digit characters
-            cleaned_number = re.sub(r'\D', '', to_phone_number)
-            
-            # Default to US/Canada if no country code (+1)
-            if not cleaned_number.startswith('1'):
-                cleaned_number = '1' + cleaned_number
-            formatted_number = '+' + cleaned_number
-            logging.info(f"Reformatted phone number from {to_phone_number} to {formatted_number}")
-        
-        # Validate the phone number has sufficient digits after formatting
-        # Most international numbers should have at least 7 digits plus country code
-        digits_only = re.sub(r'\D', '', formatted_number)
-        if len(digits_only) < 8:
-            logging.error(f"Phone number too short after formatting: {formatted_number} (digits: {len(digits_only)})")
-            return {
-                "success": False,
-                "error": f"Phone number is invalid or too short: {formatted_number}",
-                "timestamp": datetime.now().isoformat()
-            }
-        
-        # Check Twilio configuration
-        if not TWILIO_ACCOUNT_SID or TWILIO_ACCOUNT_SID == "your_twilio_account_sid":
-            logging.error("Twilio account SID not configured")
-            return {
-                "success": False,
-                "error": "Twilio credentials not properly configured",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        if not TWILIO_AUTH_TOKEN or TWILIO_AUTH_TOKEN == "your_twilio_auth_token":
-            logging.error("Twilio auth token not configured")
-            return {
-                "success": False,
-                "error": "Twilio credentials not properly configured",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        if not TWILIO_PHONE_NUMBER or TWILIO_PHONE_NUMBER == "your_twilio_phone_number":
-            logging.error("Twilio phone number not configured")
-            return {
-                "success": False,
-                "error": "Twilio phone number not properly configured",
-                "timestamp": datetime.now().isoformat()
-            }
+        formatted_number, prepared = _prepare_sos_message(
+            to_phone_number, user_name, latitude, longitude, custom_message, live_url
+        )
+        if formatted_number is None:
+            return prepared
         
         # Create Twilio client
         client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
         
-        # Format the message
-        google_maps_link = f"https://www.google.com/maps?q={latitude},{longitude}"
-        
-        message_body = f"SOS ALERT: {user_name} needs emergency assistance! "
-        message_body += f"Location: {google_maps_link} "
-        
-        if custom_message:
-            message_body += f"Message: {custom_message} "
-            
-        message_body += f"Sent at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
         # Send the message
-        logging.info(f"Sending SOS message to {formatted_number}: {message_body[:50]}...")
+        logging.info(f"Sending SOS message to {formatted_number}: {prepared[:50]}...")
         message = client.messages.create(
-            body=message_body,
+            body=prepared,
             from_=TWILIO_PHONE_NUMBER,
             to=formatted_number
         )
         
-        logging.info(f"SOS message sent to {formatted_number} with SID: {message.sid}")
+        return _sent_result(message, formatted_number)
+    
+    except Exception as e:
+        return _failed_result(to_phone_number, e)
+
+async def send_sos_message_async(to_phone_number, user_name, latitude, longitude, custom_message=None, client=None, live_url=None):
+    """
+    Send an SOS message using Twilio without blocking the event loop
+    
+    Args:
+        to_phone_number (str): The recipient's phone number
+        user_name (str): The name of the user requesting help
+        latitude (float): The user's current latitude
+        longitude (float): The user's current longitude
+        custom_message (str, optional): Custom message to include
+        client (Client, optional): Twilio client built on AsyncTwilioHttpClient
+        live_url (str, optional): Link that always shows the latest location
+    
+    Returns:
+        dict: Status of the message send operation
+    """
+    logging.info(f"Preparing to send SOS message to {to_phone_number}")
+    
+    try:
+        formatted_number, prepared = _prepare_sos_message(
+            to_phone_number, user_name, latitude, longitude, custom_message, live_url
+        )
+        if formatted_number is None:
+            return prepared
         
-        return {
-            "success": True,
-            "message_sid": message.sid,
-            "recipient": formatted_number,
+        owns_client = client is None
+        if owns_client:
+            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient())
+        
+        try:
+            logging.info(f"Sending SOS message to {formatted_number}: {prepared[:50]}...")
+            message = await client.messages.create_async(
+                body=prepared,
+                from_=TWILIO_PHONE_NUMBER,
+                to=formatted_number
+            )
+        finally:
+            if owns_client:
+                await client.http_client.close()
+        
+        return _sent_result(message, formatted_number)
+    
+    except Exception as e:
+        return _failed_result(to_phone_number, e)
+
+def _prepare_sos_message(to_phone_number, user_name, latitude, longitude, custom_message=None, live_url=None):
+    """
+    Validate the recipient and Twilio configuration and build the SOS text
+    
+    Returns:
+        tuple: (formatted_number, message_body) on success, or
+            (None, error_result) when the message cannot be sent
+    """
+    # Validate the phone number first
+    if not to_phone_number:
+        logging.error("Empty phone number provided")
+        return None, {
+            "success": False,
+            "error": "Empty phone number provided",
             "timestamp": datetime.now().isoformat()
         }
     
-    except Exception as e:
-        logging.error(f"Error sending SOS message to {to_phone_number}: {str(e)}")
-        return {
+    # Ensure the phone number has a + prefix for the country code
+    # If it doesn't start with +, assume it needs proper E.164 formatting
+    formatted_number = to_phone_number
+    if not to_phone_number.startswith('+'):
+        # Remove any non-digit characters
+        cleaned_number = re.sub(r'\D', '', to_phone_number)
+        
+        # Default to US/Canada if no country code (+1)
+        if not cleaned_number.startswith('1'):
+            cleaned_number = '1' + cleaned_number
+        formatted_number = '+' + cleaned_number
+        logging.info(f"Reformatted phone number from {to_phone_number} to {formatted_number}")
+    
+    # Validate the phone number has sufficient digits after formatting
+    # Most international numbers should have at least 7 digits plus country code
+    digits_only = re.sub(r'\D', '', formatted_number)
+    if len(digits_only) < 8:
+        logging.error(f"Phone number too short after formatting: {formatted_number} (digits: {len(digits_only)})")
+        return None, {
+            "success": False,
+            "error": f"Phone number is invalid or too short: {formatted_number}",
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    # Check Twilio configuration
+    if not TWILIO_ACCOUNT_SID or TWILIO_ACCOUNT_SID == "your_twilio_account_sid":
+        logging.error("Twilio account SID not configured")
+        return None, {
+            "success": False,
+            "error": "Twilio credentials not properly configured",
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    if not TWILIO_AUTH_TOKEN or TWILIO_AUTH_TOKEN == "your_twilio_auth_token":
+        logging.error("Twilio auth token not configured")
+        return None, {
+            "success": False,
+            "error": "Twilio credentials not properly configured",
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    if not TWILIO_PHONE_NUMBER or TWILIO_PHONE_NUMBER == "your_twilio_phone_number":
+        logging.error("Twilio phone number not configured")
+        return None, {
             "success": False,
-            "error": str(e),
-            "recipient": to_phone_number,
+            "error": "Twilio phone number not properly configured",
             "timestamp": datetime.now().isoformat()
         }
+    
+    # Format the message
+    google_maps_link = f"https://www.google.com/maps?q={latitude},{longitude}"
+    
+    message_body = f"SOS ALERT: {user_name} needs emergency assistance! "
+    message_body += f"Location: {google_maps_link} "
+    
+    if live_url:
+        message_body += f"Live location: {live_url} "
+    
+    if custom_message:
+        message_body += f"Message: {custom_message} "
+        
+    message_body += f"Sent at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    
+    return formatted_number, message_body
+
+def _sent_result(message, formatted_number):
+    """Build the result dict for a message Twilio accepted"""
+    logging.info(f"SOS message sent to {formatted_number} with SID: {message.sid}")
+    
+    return {
+        "success": True,
+        "message_sid": message.sid,
+        "recipient": formatted_number,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def _failed_result(to_phone_number, error):
+    """Build the result dict for a send that raised"""
+    logging.error(f"Error sending SOS message to {to_phone_number}: {str(error)}")
+    return {
+        "success": False,
+        "error": str(error),
+        "recipient": to_phone_number,
+        "timestamp": datetime.now().isoformat()
+    }
 
 def send_multiple_sos_messages(emergency_contacts, user_name, latitude, longitude, custom_message=None):
     """
@@ -184,6 +259,85 @@ def send_multiple_sos_messages(emergency_contacts, user_name, latitude, longitud
                 }
             })
     
+    return _summarize_sos_results(emergency_contacts, results, successful_sends)
+
+async def send_multiple_sos_messages_async(emergency_contacts, user_name, latitude, longitude, custom_message=None, live_url=None):
+    """
+    Send SOS messages to multiple emergency contacts concurrently
+    
+    Args:
+        emergency_contacts (list): List of emergency contact objects with phone numbers
+        user_name (str): The name of the user requesting help
+        latitude (float): The user's current latitude
+        longitude (float): The user's current longitude
+        custom_message (str, optional): Custom message to include
+        live_url (str, optional): Link that always shows the latest location
+    
+    Returns:
+        dict: Results of all message send operations
+    """
+    if not emergency_contacts:
+        logging.error("No emergency contacts provided")
+        return {
+            "success": False,
+            "error": "No emergency contacts provided",
+            "results": [],
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    logging.info(f"Sending SOS messages to {len(emergency_contacts)} contacts")
+    
+    # One HTTP session shared by every send so the requests overlap
+    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=AsyncTwilioHttpClient())
+    try:
+        sends = [
+            send_sos_message_async(
+                contact.phone,
+                user_name,
+                latitude,
+                longitude,
+                custom_message,
+                client=client,
+                live_url=live_url
+            )
+            for contact in emergency_contacts
+        ]
+        send_results = await asyncio.gather(*sends, return_exceptions=True)
+    finally:
+        await client.http_client.close()
+    
+    results = []
+    successful_sends = 0
+    
+    for contact, result in zip(emergency_contacts, send_results):
+        if isinstance(result, Exception):
+            logging.error(f"Error processing contact {getattr(contact, 'name', 'Unknown')}: {str(result)}")
+            results.append({
+                "contact_name": getattr(contact, 'name', 'Unknown'),
+                "contact_phone": getattr(contact, 'phone', 'Unknown'),
+                "result": {
+                    "success": False,
+                    "error": f"Failed to process contact: {str(result)}",
+                    "timestamp": datetime.now().isoformat()
+                }
+            })
+            continue
+        
+        # Track successful sends
+        if result.get("success", False):
+            successful_sends += 1
+            
+        results.append({
+            "contact_name": contact.name,
+            "contact_phone": contact.phone,
+            "relationship": getattr(contact, 'relationship', 'Not specified'),
+            "result": result
+        })
+    
+    return _summarize_sos_results(emergency_contacts, results, successful_sends)
+
+def _summarize_sos_results(emergency_contacts, results, successful_sends):
+    """Build the overall response for a batch of SOS sends"""
     # Consider partial success if at least one message was sent
     overall_success = successful_sends > 0
     
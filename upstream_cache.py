@@ -0,0 +1,185 @@
+import os
+import json
+import zlib
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+# Cache settings from environment
+UPSTREAM_CACHE_URL = os.environ.get(
+    "UPSTREAM_CACHE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "routewatch-upstream-cache.sqlite")
+)
+UPSTREAM_CACHE_MAX_BYTES = int(os.environ.get("UPSTREAM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+UPSTREAM_CACHE_EVICT_EVERY = int(os.environ.get("UPSTREAM_CACHE_EVICT_EVERY", 100))
+TRAFFIC_CACHE_TTL = int(os.environ.get("TRAFFIC_CACHE_TTL", 60))
+ROUTE_CACHE_TTL = int(os.environ.get("ROUTE_CACHE_TTL", 600))
+
+class CacheBackend(ABC):
+    """
+    Interface for caches shared by every worker process
+    
+    Values are JSON-compatible objects. Backends must treat their own
+    failures as cache misses so that callers can fall through to upstream.
+    """
+    
+    @abstractmethod
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+    
+    @abstractmethod
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds"""
+    
+    @abstractmethod
+    def delete(self, key):
+        """Remove key if present"""
+    
+    @abstractmethod
+    def clear(self):
+        """Remove every entry"""
+
+class NullCache(CacheBackend):
+    """Backend that never stores anything, used when caching is disabled"""
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, value, ttl):
+        pass
+    
+    def delete(self, key):
+        pass
+    
+    def clear(self):
+        pass
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a local SQLite file in WAL mode
+    
+    Every process on the host opens the same file, so one worker's upstream
+    response is visible to all of them. Values are stored as zlib-compressed
+    JSON. When the stored payloads exceed max_bytes, expired entries are
+    dropped first, then the entries closest to expiry. The size is checked
+    every evict_every writes from each process.
+    """
+    
+    def __init__(self, path, max_bytes=UPSTREAM_CACHE_MAX_BYTES, evict_every=UPSTREAM_CACHE_EVICT_EVERY):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+        self._local = threading.local()
+    
+    def _connection(self):
+        # SQLite connections must not cross threads or forked workers
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+    
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            return decode_value(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logging.error(f"Error reading upstream cache: {str(e)}")
+            return None
+    
+    def set(self, key, value, ttl):
+        try:
+            payload = encode_value(value)
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time() + ttl)
+            )
+            
+            # Summing the sizes scans the table, so only check every few writes;
+            # the cache may overshoot max_bytes by that many entries meanwhile
+            self._writes += 1
+            if self._writes >= self.evict_every:
+                self._writes = 0
+                self._evict(connection)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.error(f"Error writing upstream cache: {str(e)}")
+    
+    def delete(self, key):
+        try:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting from upstream cache: {str(e)}")
+    
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            logging.error(f"Error clearing upstream cache: {str(e)}")
+    
+    def _evict(self, connection):
+        """Trim the cache back under max_bytes"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        
+        # Drop the entries that would expire soonest until we fit again
+        rows = connection.execute("SELECT key, size FROM cache ORDER BY expires_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM cache WHERE key = ?", doomed)
+
+def encode_value(value):
+    """Serialize a JSON-compatible value to compact bytes"""
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+def decode_value(payload):
+    """Inverse of encode_value"""
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+def make_cache_key(namespace, *parts):
+    """Build a cache key; floats are rounded so equal coordinates share a key"""
+    formatted = [f"{part:.5f}" if isinstance(part, float) else str(part) for part in parts]
+    return namespace + ':' + '|'.join(formatted)
+
+# Backends by URL scheme; a networked store can register itself here
+CACHE_BACKENDS = {
+    'sqlite': lambda location: SQLiteCache(location),
+    'none': lambda location: NullCache(),
+}
+
+def create_cache(url):
+    """Create the cache backend named by a URL such as sqlite:///path/to/file"""
+    scheme, _, location = url.partition('://')
+    if scheme not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown upstream cache backend: {scheme}")
+    if scheme == 'sqlite':
+        # sqlite:///relative or sqlite:////absolute, as in SQLAlchemy URLs
+        location = location[1:] if location.startswith('/') else location
+    return CACHE_BACKENDS[scheme](location)
+
+# Cache shared by every worker on this host
+upstream_cache = create_cache(UPSTREAM_CACHE_URL)